@@ -1,12 +1,290 @@
 from mrjob.job import MRJob
+from mrjob.step import MRStep
+from collections import Counter
+from itertools import filterfalse, groupby, islice, tee
+from operator import itemgetter
+import heapq
+import json
 import re
+import tempfile
+
+WORD_RE = re.compile(r'\b\w+\b')
+
+# patterns for --tokenizer; --token-pattern takes any other regex
+TOKENIZERS = {
+    'word': WORD_RE.pattern,
+    'alpha': r'[^\W\d_]+',
+    'whitespace': r'\S+',
+}
+
+# rough size of one buffered word in memory (dict slot, str and int objects)
+BUFFER_ENTRY_BYTES = 128
+
+# most spilled runs kept open at once; past that they are merged into one
+MAX_OPEN_RUNS = 64
+
+def read_run(run):
+    run.seek(0)
+    for line in run:
+        word, count = json.loads(line)
+        yield word, count
+
+def merge_runs(runs):
+    # k-way merge of sorted runs, summing the counts of each word
+    merged = heapq.merge(*(read_run(run) for run in runs))
+    for word, counts in groupby(merged, key=itemgetter(0)):
+        yield word, sum(count for _, count in counts)
+
+def load_stopwords(path, lowercase=True):
+    with open(path, encoding='utf_8') as f:
+        words = (line.strip() for line in f)
+        return frozenset(word.lower() if lowercase else word
+                         for word in words if word)
+
+def ngrams(tokens, n):
+    # Space-joined n-grams from a token iterable, using tee/zip rather than
+    # building a list of windows
+    if n == 1:
+        return tokens
+    iters = tee(tokens, n)
+    for skip, it in enumerate(iters):
+        next(islice(it, skip, skip), None)
+    return map(' '.join, zip(*iters))
+
+class SpaceSaving(object):
+    # Space-Saving heavy hitters summary (Metwally et al.). At most `capacity`
+    # words are tracked; each estimate is never below the true count and
+    # overestimates it by at most its error, which is <= total / capacity.
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.total = 0
+        self.counts = {}
+        self.errors = {}
+        # one (count, word) entry per tracked word; counts may be stale
+        self.heap = []
+
+    def add(self, word, count=1):
+        self.total += count
+        if word in self.counts:
+            self.counts[word] += count
+            return
+        floor = 0
+        if len(self.counts) >= self.capacity:
+            floor = self.evict()
+        self.counts[word] = floor + count
+        self.errors[word] = floor
+        heapq.heappush(self.heap, (floor + count, word))
+
+    def evict(self):
+        # Drop the word with the smallest count and return that count
+        while True:
+            count, word = self.heap[0]
+            current = self.counts[word]
+            if current == count:
+                heapq.heappop(self.heap)
+                del self.counts[word]
+                del self.errors[word]
+                return count
+            heapq.heapreplace(self.heap, (current, word))
+
+    def floor(self):
+        # most an untracked word can have been seen
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    def merge(self, other):
+        # Mergeable summaries (Agarwal et al.): a word missing from a full
+        # summary is charged that summary's floor as count and as error
+        floors = (self.floor(), other.floor())
+        counts = {}
+        errors = {}
+        # sorted, with ties below broken by word, so the words kept don't
+        # depend on set order (and so on PYTHONHASHSEED)
+        for word in sorted(set(self.counts) | set(other.counts)):
+            counts[word] = errors[word] = 0
+            for summary, floor in zip((self, other), floors):
+                if word in summary.counts:
+                    counts[word] += summary.counts[word]
+                    errors[word] += summary.errors[word]
+                else:
+                    counts[word] += floor
+                    errors[word] += floor
+
+        keep = heapq.nlargest(self.capacity, counts, key=lambda w: (counts[w], w))
+        self.counts = dict((word, counts[word]) for word in keep)
+        self.errors = dict((word, errors[word]) for word in keep)
+        self.heap = [(count, word) for word, count in self.counts.items()]
+        heapq.heapify(self.heap)
+        self.total += other.total
+
+    def top(self, k=None):
+        # (word, estimate, error) for the k largest estimates; ties go to the
+        # larger word, as in top_k_merge
+        words = heapq.nlargest(k or len(self.counts), self.counts,
+                               key=lambda w: (self.counts[w], w))
+        return [(word, self.counts[word], self.errors[word]) for word in words]
+
+    def to_list(self):
+        return [self.capacity, self.total, self.top()]
+
+    @classmethod
+    def from_list(cls, data):
+        capacity, total, entries = data
+        summary = cls(capacity)
+        summary.total = total
+        for word, count, error in entries:
+            summary.counts[word] = count
+            summary.errors[word] = error
+            summary.heap.append((count, word))
+        heapq.heapify(summary.heap)
+        return summary
 
 class MRUniqueWordCount(MRJob):
 
+    def configure_args(self):
+        super(MRUniqueWordCount, self).configure_args()
+        self.add_passthru_arg(
+            '--combine-buffer-mb', type=int, default=64,
+            help='memory for in-mapper combining before counts are spilled '
+                 'to disk (default: %(default)s)')
+        self.add_passthru_arg(
+            '--spill-dir', default=None,
+            help='directory for spilled runs (default: system temp dir)')
+        self.add_passthru_arg(
+            '--tokenizer', choices=sorted(TOKENIZERS), default='word',
+            help='how lines are split into tokens (default: %(default)s)')
+        self.add_passthru_arg(
+            '--token-pattern', default=None,
+            help='regex matching one token; overrides --tokenizer')
+        self.add_passthru_arg(
+            '--keep-case', action='store_true',
+            help="don't lowercase lines before tokenizing")
+        self.add_file_arg(
+            '--stopwords', default=None,
+            help='file with one word per line to leave out')
+        self.add_passthru_arg(
+            '--ngram', type=int, default=1,
+            help='count runs of N consecutive tokens within a line '
+                 '(default: %(default)s)')
+        self.add_passthru_arg(
+            '--top-k', type=int, default=0,
+            help='only output the K most frequent words')
+        self.add_passthru_arg(
+            '--approx', action='store_true',
+            help='estimate heavy hitters in fixed memory with Space-Saving; '
+                 'outputs word, [estimate, max overestimate]')
+        self.add_passthru_arg(
+            '--approx-counters', type=int, default=10000,
+            help='counters per Space-Saving summary (default: %(default)s)')
+
+    def load_args(self, args):
+        super(MRUniqueWordCount, self).load_args(args)
+        # caught here rather than as an empty output or a crash in a task
+        for name, minimum in (('ngram', 1), ('approx_counters', 1), ('top_k', 0)):
+            if getattr(self.options, name) < minimum:
+                self.arg_parser.error('--%s must be at least %d' % (
+                    name.replace('_', '-'), minimum))
+
+    def steps(self):
+        if self.options.approx:
+            return [MRStep(mapper_init=self.sketch_init,
+                           mapper=self.sketch_mapper,
+                           mapper_final=self.sketch_final,
+                           reducer=self.sketch_reducer)]
+
+        count = dict(mapper_init=self.mapper_init,
+                     mapper=self.mapper,
+                     mapper_final=self.mapper_final,
+                     combiner=self.combiner)
+        if not self.options.top_k:
+            return [MRStep(reducer=self.reducer, **count)]
+
+        # keep a bounded heap per reducer, then merge them in a single one
+        return [MRStep(reducer_init=self.top_k_init,
+                       reducer=self.top_k_reducer,
+                       reducer_final=self.top_k_final,
+                       **count),
+                MRStep(reducer=self.top_k_merge)]
+
+    def default_tokenizer(self):
+        # whether tokens() does exactly what WORD_RE on a lowercased line does
+        return (self.options.tokenizer == 'word' and
+                not self.options.token_pattern and
+                not self.options.keep_case and
+                not self.options.stopwords and
+                self.options.ngram == 1)
+
+    def tokenizer_init(self):
+        # Compile the tokenizer pipeline once per task instead of once per line
+        findall = re.compile(self.options.token_pattern or
+                             TOKENIZERS[self.options.tokenizer]).findall
+        lowercase = not self.options.keep_case
+        stopwords = None
+        if self.options.stopwords:
+            stopwords = load_stopwords(self.options.stopwords, lowercase)
+        n = self.options.ngram
+
+        def tokens(line):
+            words = findall(line.lower() if lowercase else line)
+            if stopwords:
+                words = filterfalse(stopwords.__contains__, words)
+            return ngrams(words, n)
+
+        self.tokens = tokens
+
+    def mapper_init(self):
+        self.tokenizer_init()
+        # Combine counts inside the mapper instead of yielding (word, 1)
+        self.buffer = Counter()
+        self.max_buffer_entries = max(
+            1, (self.options.combine_buffer_mb << 20) // BUFFER_ENTRY_BYTES)
+        self.runs = []
+
     def mapper(self, _, line):
-        words = re.findall(r'\b\w+\b', line.lower())
-        for word in words:
-            yield word, 1
+        self.buffer.update(self.tokens(line))
+        if len(self.buffer) >= self.max_buffer_entries:
+            self.spill()
+
+    def write_run(self, items):
+        run = tempfile.TemporaryFile(mode='w+', encoding='utf_8',
+                                     dir=self.options.spill_dir)
+        # one JSON array per line, since --token-pattern can match tabs
+        for word, count in items:
+            run.write(json.dumps([word, count]) + '\n')
+        self.runs.append(run)
+
+    def spill(self):
+        # Write the buffer out as a sorted run and start a fresh one
+        self.write_run(sorted(self.buffer.items()))
+        self.buffer = Counter()
+        self.increment_counter('wordcount', 'spilled_runs')
+
+        if len(self.runs) >= MAX_OPEN_RUNS:
+            runs, self.runs = self.runs, []
+            self.write_run(merge_runs(runs))
+            for run in runs:
+                run.close()
+
+    def mapper_final(self):
+        if not self.runs:
+            self.increment_counter('wordcount', 'map_output_records',
+                                   len(self.buffer))
+            yield from self.buffer.items()
+            return
+
+        # merge the spilled runs so each word leaves the mapper once
+        self.spill()
+        num_records = 0
+        for word, count in merge_runs(self.runs):
+            num_records += 1
+            yield word, count
+        self.increment_counter('wordcount', 'map_output_records', num_records)
+
+        for run in self.runs:
+            run.close()
+        self.runs = []
 
     def combiner(self, word, counts):
         yield word, sum(counts)
@@ -14,5 +292,51 @@ class MRUniqueWordCount(MRJob):
     def reducer(self, word, counts):
         yield word, sum(counts)
 
+    def top_k_init(self):
+        self.top = []
+
+    def top_k_reducer(self, word, counts):
+        entry = (sum(counts), word)
+        if len(self.top) < self.options.top_k:
+            heapq.heappush(self.top, entry)
+        else:
+            heapq.heappushpop(self.top, entry)
+
+    def top_k_final(self):
+        for count, word in self.top:
+            yield None, [count, word]
+
+    def top_k_merge(self, _, entries):
+        # most frequent first; ties go to the larger word
+        top = heapq.nlargest(self.options.top_k,
+                             (tuple(entry) for entry in entries))
+        for count, word in top:
+            yield word, count
+
+    def sketch_init(self):
+        self.tokenizer_init()
+        self.sketch = SpaceSaving(self.options.approx_counters)
+
+    def sketch_mapper(self, _, line):
+        for word in self.tokens(line):
+            self.sketch.add(word)
+
+    def sketch_final(self):
+        yield None, self.sketch.to_list()
+
+    def sketch_reducer(self, _, sketches):
+        # merging then truncating depends on the order, and mappers finish in
+        # any order, so merge the summaries in a fixed one
+        merged = None
+        for data in sorted(sketches):
+            sketch = SpaceSaving.from_list(data)
+            if merged is None:
+                merged = sketch
+            else:
+                merged.merge(sketch)
+
+        for word, count, error in merged.top(self.options.top_k):
+            yield word, [count, error]
+
 if __name__ == '__main__':
     MRUniqueWordCount.run()
@@ -0,0 +1,232 @@
+"""Benchmark MRUniqueWordCount on synthetic Zipf corpora under every runner.
+
+Usage:
+    python benchmark.py [--sizes 1MB,100MB,1GB] [--seed 42] [--runners inline,native]
+                        [--output results.json] [--baseline baseline.json]
+                        [--save-baseline] [--tolerance 0.1] [-- job options]
+
+Corpora are generated once per (size, seed) into --corpus-dir and reused.
+Each runner is run in its own process; we record wall time, peak RSS (of the
+largest process in the runner's process tree), records shuffled (from the
+job's counters) and throughput, plus a hash of the output so runners that
+disagree are flagged. With --baseline, results are compared against an
+earlier run and the script exits non-zero on regressions.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from itertools import accumulate
+
+from native_runner import native_command, split_job_args
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+RUNNERS = {
+    'inline': [sys.executable, 'MapReduce.py', '-r', 'inline'],
+    'local': [sys.executable, 'MapReduce.py', '-r', 'local'],
+    'native': [sys.executable, 'native_runner.py'],
+    'native-mmap': [sys.executable, 'native_runner.py', '--mmap'],
+}
+
+UNITS = {'KB': 1 << 10, 'MB': 1 << 20, 'GB': 1 << 30}
+
+COUNTER_RE = re.compile(r'^\s+(\w+)=(\d+)$', re.M)
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'pu',
+             'dra', 'ble', 'sch', 'ing', 'or', 'an']
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    for unit, factor in UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def make_vocabulary(rng, size):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES)
+                          for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+
+def generate_corpus(path, size, seed, vocab_size=50000, zipf_s=1.1,
+                    words_per_line=12):
+    # Same (size, seed, vocab_size, zipf_s) always gives the same bytes
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng, vocab_size)
+    rng.shuffle(vocabulary)
+    cum_weights = list(accumulate(1.0 / (rank ** zipf_s)
+                                  for rank in range(1, vocab_size + 1)))
+
+    tmp_path = path + '.tmp'
+    written = 0
+    with open(tmp_path, 'w', encoding='ascii') as f:
+        while written < size:
+            words = rng.choices(vocabulary, cum_weights=cum_weights,
+                                k=words_per_line * 1000)
+            block = '\n'.join(' '.join(words[i:i + words_per_line])
+                              for i in range(0, len(words), words_per_line))
+            block = block[:size - written - 1] + '\n'
+            f.write(block)
+            written += len(block)
+    os.rename(tmp_path, path)
+
+
+def corpus_path(corpus_dir, size, seed):
+    path = os.path.join(corpus_dir, 'zipf-%d-%d.txt' % (size, seed))
+    if not os.path.exists(path):
+        print('generating %s' % path, file=sys.stderr)
+        generate_corpus(path, size, seed)
+    return path
+
+
+def run_one(runner, path, job_args):
+    command = RUNNERS[runner] + [path]
+    if runner.startswith('native'):
+        command = native_command(command, job_args)
+    else:
+        command += job_args
+
+    output_hash = hashlib.md5()
+    start = time.perf_counter()
+    proc = subprocess.Popen(command, cwd=HERE, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    # read stderr on the side so neither pipe can fill up and block
+    stderr_chunks = []
+    reader = threading.Thread(
+        target=lambda: stderr_chunks.append(proc.stderr.read()))
+    reader.start()
+    for chunk in iter(lambda: proc.stdout.read(1 << 16), b''):
+        output_hash.update(chunk)
+    # wait4 rather than proc.wait() so we also get the child's rusage
+    _, status, rusage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    reader.join()
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    proc.stdout.close()
+    proc.stderr.close()
+
+    stderr = b''.join(stderr_chunks).decode('utf_8', 'replace')
+    if proc.returncode:
+        raise RuntimeError('%s failed:\n%s' % (' '.join(command), stderr))
+
+    counters = dict((name, int(value))
+                    for name, value in COUNTER_RE.findall(stderr))
+    size = os.path.getsize(path)
+    return {
+        'runner': runner,
+        'size': size,
+        'wall_s': round(wall, 3),
+        # ru_maxrss is in KB on Linux
+        'peak_rss_mb': round(rusage.ru_maxrss / 1024.0, 1),
+        'records_shuffled': counters.get('records_shuffled',
+                                         counters.get('map_output_records')),
+        'mb_per_s': round(size / float(1 << 20) / wall, 2),
+        'output_md5': output_hash.hexdigest(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    # Regressions against a previous results file, as readable strings
+    previous = dict(((r['runner'], r['size']), r) for r in baseline['results'])
+    regressions = []
+    for result in results:
+        old = previous.get((result['runner'], result['size']))
+        if old is None:
+            continue
+        if result['mb_per_s'] < old['mb_per_s'] * (1 - tolerance):
+            regressions.append('%s @ %d bytes: throughput %.2f -> %.2f MB/s' % (
+                result['runner'], result['size'], old['mb_per_s'],
+                result['mb_per_s']))
+        if result['peak_rss_mb'] > old['peak_rss_mb'] * (1 + tolerance):
+            regressions.append('%s @ %d bytes: peak RSS %.1f -> %.1f MB' % (
+                result['runner'], result['size'], old['peak_rss_mb'],
+                result['peak_rss_mb']))
+        if result['output_md5'] != old['output_md5']:
+            regressions.append('%s @ %d bytes: output changed' % (
+                result['runner'], result['size']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1MB,10MB',
+                        help='comma-separated corpus sizes, 1MB to 10GB '
+                             '(default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--runners', default=','.join(RUNNERS),
+                        help='comma-separated runners (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='runs per runner and size; the fastest is kept')
+    parser.add_argument('--corpus-dir', default=os.path.join(HERE, 'bench_data'))
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', default=None,
+                        help='results file to check for regressions against')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='also write the results to --baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='allowed slowdown/growth before it counts as a '
+                             'regression (default: %(default)s)')
+    argv, job_args = split_job_args(sys.argv[1:])
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.corpus_dir, exist_ok=True)
+    runners = args.runners.split(',')
+    for runner in runners:
+        if runner not in RUNNERS:
+            parser.error('unknown runner %r' % runner)
+
+    results = []
+    for size in map(parse_size, args.sizes.split(',')):
+        path = corpus_path(args.corpus_dir, size, args.seed)
+        hashes = set()
+        for runner in runners:
+            runs = [run_one(runner, path, job_args) for _ in range(args.repeat)]
+            result = min(runs, key=lambda r: r['wall_s'])
+            results.append(result)
+            hashes.add(result['output_md5'])
+            print('%-12s %12d bytes %9.3fs %8.1f MB RSS %10s records %9.2f MB/s' % (
+                runner, size, result['wall_s'], result['peak_rss_mb'],
+                result['records_shuffled'], result['mb_per_s']))
+        if len(hashes) > 1:
+            print('WARNING: runners disagree on the output for %d bytes' % size,
+                  file=sys.stderr)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': args.seed,
+        'job_args': job_args,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if args.baseline:
+        if args.save_baseline:
+            with open(args.baseline, 'w') as f:
+                json.dump(report, f, indent=2)
+        else:
+            with open(args.baseline) as f:
+                regressions = compare(results, json.load(f), args.tolerance)
+            for regression in regressions:
+                print('REGRESSION: ' + regression, file=sys.stderr)
+            if regressions:
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
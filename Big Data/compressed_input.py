@@ -0,0 +1,113 @@
+"""Stream lines out of .gz, .bz2 and .zst shards with a bounded read-ahead.
+
+A producer thread decompresses fixed-size blocks into a bounded queue while
+the caller tokenizes the blocks it already has. gzip, bz2 and zstandard all
+release the GIL while decompressing, so the two really run at the same time,
+and at most `readahead` blocks are ever held in memory.
+
+.zst support needs the optional zstandard package.
+"""
+import bz2
+import gzip
+import queue
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSED_EXTENSIONS = ('.gz', '.bz2', '.zst')
+
+DEFAULT_BLOCK_SIZE = 1 << 20
+DEFAULT_READAHEAD = 8
+
+# put() timeout, so the producer notices when the consumer went away
+PUT_TIMEOUT = 0.1
+
+
+def is_compressed(path):
+    return path.endswith(COMPRESSED_EXTENSIONS)
+
+
+def open_shard(path):
+    # Binary file object yielding the decompressed contents of path
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError('reading %s needs the zstandard package' % path)
+        return zstandard.ZstdDecompressor().stream_reader(
+            open(path, 'rb'), read_across_frames=True, closefd=True)
+    return open(path, 'rb')
+
+
+def _produce(path, block_size, blocks, stop):
+    try:
+        with open_shard(path) as f:
+            while not stop.is_set():
+                block = f.read(block_size)
+                if not block:
+                    break
+                while not stop.is_set():
+                    try:
+                        blocks.put(block, timeout=PUT_TIMEOUT)
+                        break
+                    except queue.Full:
+                        pass
+        item = None
+    except Exception as error:
+        item = error
+    # the end-of-stream marker (or the error) must always get through
+    while not stop.is_set():
+        try:
+            blocks.put(item, timeout=PUT_TIMEOUT)
+            break
+        except queue.Full:
+            pass
+
+
+def iter_blocks(path, block_size=DEFAULT_BLOCK_SIZE, readahead=DEFAULT_READAHEAD):
+    # Decompressed blocks of path, read ahead by a producer thread
+    blocks = queue.Queue(maxsize=readahead)
+    stop = threading.Event()
+    producer = threading.Thread(target=_produce,
+                                args=(path, block_size, blocks, stop),
+                                daemon=True)
+    producer.start()
+    try:
+        while True:
+            block = blocks.get()
+            if block is None:
+                return
+            if isinstance(block, Exception):
+                raise block
+            yield block
+    finally:
+        stop.set()
+        producer.join()
+
+
+def iter_line_blocks(path, **kwargs):
+    # Like iter_blocks(), but every block ends on a line boundary
+    pending = b''
+    for block in iter_blocks(path, **kwargs):
+        cut = block.rfind(b'\n') + 1
+        if not cut:
+            pending += block
+            continue
+        yield pending + block[:cut]
+        pending = block[cut:]
+    if pending:
+        yield pending
+
+
+def iter_lines(path, **kwargs):
+    # Lines of path without their trailing newline
+    for block in iter_line_blocks(path, **kwargs):
+        lines = block.split(b'\n')
+        if not lines[-1]:
+            lines.pop()
+        yield from lines
@@ -0,0 +1,96 @@
+"""Compare the --approx Space-Saving estimates against exact word counts.
+
+Usage:
+    python heavy_hitters_report.py input.txt [more inputs ...] [--counters M] [--top-k K]
+
+Exact counts come from mmap_tokenizer, estimates from a single SpaceSaving
+summary fed the same words the mapper sees. The report checks the guarantees
+(estimate >= true count, estimate - error <= true count, error <= N / M) and
+shows how well the top K words were recovered.
+
+This is one summary over the whole input. The job itself keeps one summary
+per map task and merges them in the reducer, which keeps the same
+guarantees but can keep other words with other estimates; the report does
+not check that merged output.
+"""
+import argparse
+from collections import Counter
+
+from MapReduce import WORD_RE, SpaceSaving
+from mmap_tokenizer import count_file, decode_run
+
+
+def exact_counts(paths):
+    counts = Counter()
+    for path in paths:
+        counts.update(count_file(path))
+    return counts
+
+
+def approx_counts(paths, capacity):
+    summary = SpaceSaving(capacity)
+    for path in paths:
+        with open(path, 'rb') as f:
+            for line in f:
+                for word in WORD_RE.findall(decode_run(line).lower()):
+                    summary.add(word)
+    return summary
+
+
+def error_report(exact, summary, k):
+    total = sum(exact.values())
+    estimates = summary.top()
+    errors = [count - exact[word] for word, count, _ in estimates]
+
+    exact_top = [word for word, _ in exact.most_common(k)]
+    approx_top = [word for word, _, _ in summary.top(k)]
+
+    return {
+        'tokens': total,
+        'distinct_words': len(exact),
+        'counters': summary.capacity,
+        'guaranteed_max_error': total / summary.capacity,
+        'max_error': max(errors, default=0),
+        'mean_error': sum(errors) / len(errors) if errors else 0.0,
+        'underestimates': sum(1 for error in errors if error < 0),
+        'bound_violations': sum(1 for (word, count, error) in estimates
+                                if count - error > exact[word]),
+        'top_k': k,
+        'top_k_recall': len(set(exact_top) & set(approx_top)) / k if k else 1.0,
+        'top_k_words': [(word, exact[word], summary.counts.get(word),
+                         summary.errors.get(word)) for word in exact_top],
+    }
+
+
+def print_report(report):
+    print('Tokens:               %d' % report['tokens'])
+    print('Distinct words:       %d' % report['distinct_words'])
+    print('Counters:             %d' % report['counters'])
+    print('Guaranteed max error: %.1f' % report['guaranteed_max_error'])
+    print('Observed max error:   %d' % report['max_error'])
+    print('Observed mean error:  %.2f' % report['mean_error'])
+    print('Underestimates:       %d' % report['underestimates'])
+    print('Bound violations:     %d' % report['bound_violations'])
+    print('Top-%d recall:        %.2f' % (report['top_k'], report['top_k_recall']))
+    print()
+    print('%-20s %12s %12s %12s' % ('Word', 'Exact', 'Estimate', 'Error bound'))
+    for word, count, estimate, error in report['top_k_words']:
+        print('%-20s %12d %12s %12s' % (word, count, estimate, error))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('paths', nargs='+', help='input files')
+    parser.add_argument('--counters', type=int, default=10000,
+                        help='Space-Saving counters (default: %(default)s)')
+    parser.add_argument('--top-k', type=int, default=20,
+                        help='heavy hitters to compare (default: %(default)s)')
+    args = parser.parse_args()
+
+    exact = exact_counts(args.paths)
+    summary = approx_counts(args.paths, args.counters)
+    print_report(error_report(exact, summary, args.top_k))
+
+
+if __name__ == '__main__':
+    main()
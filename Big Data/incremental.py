@@ -0,0 +1,257 @@
+"""Keep MRUniqueWordCount's output up to date without recounting the corpus.
+
+Usage:
+    python incremental.py --state wordcount.db input_dir_or_file [...] [--workers N]
+                          [--output counts.txt] [--remove-missing]
+
+Word counts live in a SQLite state file next to a manifest of every input
+file's size, mtime and a fingerprint of its last bytes. On each run only new
+or changed files are mapped:
+
+- unchanged files (same size and mtime) are skipped
+- files that only grew are counted from their old end onwards (compressed
+  shards are always counted again as a whole)
+- files that were rewritten or truncated have their old counts subtracted
+  and are counted again
+
+Subtracting needs every file's own counts, so the state holds one row per
+distinct word of each file, besides the merged counts.
+
+Files in the manifest that are not among this run's inputs are left as they
+are, so counting a subset of the corpus doesn't lose the rest. With
+--remove-missing the inputs define the corpus instead: those files have
+their counts subtracted and leave the manifest.
+
+Each map task's counts go into a temporary staging table as soon as the
+task finishes, so memory holds one task's counts rather than the whole
+delta. The staged counts are applied in the same transaction as the
+manifest, so a failed run leaves the old state. The merged counts are then
+written out in the job's normal output format.
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+from collections import Counter
+from multiprocessing import Pool
+
+from MapReduce import MRUniqueWordCount
+from compressed_input import is_compressed
+from native_runner import (DEFAULT_CHUNK_MB, count_chunk, expand_inputs,
+                           sort_key, split_range)
+
+# bytes before the old end of file that must still match for an append
+TAIL_SIZE = 4096
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS manifest ("
+    "path TEXT PRIMARY KEY,"
+    "size INTEGER NOT NULL,"
+    "mtime_ns INTEGER NOT NULL,"
+    "tail_hash BLOB NOT NULL"
+    ") WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS file_counts ("
+    "path TEXT NOT NULL,"
+    "word TEXT NOT NULL,"
+    "count INTEGER NOT NULL,"
+    "PRIMARY KEY (path, word)"
+    ") WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS counts ("
+    "word TEXT PRIMARY KEY,"
+    "count INTEGER NOT NULL"
+    ") WITHOUT ROWID",
+    # this run's counts, per file, until they are applied
+    "CREATE TEMP TABLE IF NOT EXISTS delta ("
+    "path TEXT NOT NULL,"
+    "word TEXT NOT NULL,"
+    "count INTEGER NOT NULL,"
+    "PRIMARY KEY (path, word)"
+    ") WITHOUT ROWID",
+]
+
+
+def open_state(path):
+    db = sqlite3.connect(path)
+    for statement in SCHEMA:
+        db.execute(statement)
+    return db
+
+
+def tail_hash(path, end):
+    with open(path, 'rb') as f:
+        f.seek(max(0, end - TAIL_SIZE))
+        return hashlib.sha1(f.read(end - max(0, end - TAIL_SIZE))).digest()
+
+
+def plan(db, paths, remove_missing=False):
+    # Work out what has to be counted: returns (ranges, forget, seen, stats)
+    # where ranges are (path, start, end), forget are paths whose old counts
+    # go and seen is the (size, mtime) each counted file was planned with
+    manifest = dict((row[0], row[1:]) for row in
+                    db.execute("SELECT path, size, mtime_ns, tail_hash FROM manifest"))
+    ranges = []
+    forget = []
+    seen = {}
+    stats = Counter()
+
+    for path in map(os.path.abspath, paths):
+        st = os.stat(path)
+        seen[path] = (st.st_size, st.st_mtime_ns)
+        old = manifest.pop(path, None)
+        if old is None:
+            stats['new'] += 1
+            ranges.append((path, 0, st.st_size))
+            continue
+
+        old_size, old_mtime, old_tail = old
+        if st.st_size == old_size and st.st_mtime_ns == old_mtime:
+            stats['unchanged'] += 1
+        elif (st.st_size > old_size and not is_compressed(path)
+                and tail_hash(path, old_size) == old_tail
+                and ends_with_newline(path, old_size)):
+            stats['appended'] += 1
+            ranges.append((path, old_size, st.st_size))
+        else:
+            stats['changed'] += 1
+            forget.append(path)
+            ranges.append((path, 0, st.st_size))
+
+    # whatever is left in the manifest wasn't given this time; it only
+    # leaves the corpus when asked to
+    if remove_missing:
+        stats['removed'] = len(manifest)
+        forget.extend(manifest)
+    else:
+        stats['not_given'] = len(manifest)
+    return ranges, forget, seen, stats
+
+
+def ends_with_newline(path, end):
+    # an append only leaves old words intact if the old last line was complete
+    if end == 0:
+        return True
+    with open(path, 'rb') as f:
+        f.seek(end - 1)
+        return f.read(1) == b'\n'
+
+
+def count_range(chunk):
+    return chunk[0], count_chunk(*chunk)
+
+
+def forget_file(db, path):
+    db.execute(
+        "UPDATE counts SET count = count - ("
+        " SELECT fc.count FROM file_counts fc"
+        " WHERE fc.path = ? AND fc.word = counts.word)"
+        " WHERE word IN (SELECT word FROM file_counts WHERE path = ?)",
+        (path, path))
+    db.execute("DELETE FROM counts WHERE count <= 0")
+    db.execute("DELETE FROM file_counts WHERE path = ?", (path,))
+    db.execute("DELETE FROM manifest WHERE path = ?", (path,))
+
+
+def stage_delta(db, path, counts):
+    db.executemany(
+        "INSERT INTO delta (path, word, count) VALUES (?, ?, ?)"
+        " ON CONFLICT (path, word) DO UPDATE SET count = count + excluded.count",
+        ((path, word, count) for word, count in counts.items()))
+
+
+def apply_delta(db):
+    # "WHERE true" keeps SQLite from reading ON CONFLICT as a join clause
+    db.execute(
+        "INSERT INTO file_counts (path, word, count)"
+        " SELECT path, word, count FROM delta WHERE true"
+        " ON CONFLICT (path, word) DO UPDATE SET count = count + excluded.count")
+    db.execute(
+        "INSERT INTO counts (word, count)"
+        " SELECT word, SUM(count) FROM delta GROUP BY word"
+        " ON CONFLICT (word) DO UPDATE SET count = count + excluded.count")
+    db.execute("DELETE FROM delta")
+
+
+def record_file(db, path, size, mtime_ns):
+    db.execute(
+        "INSERT OR REPLACE INTO manifest (path, size, mtime_ns, tail_hash)"
+        " VALUES (?, ?, ?, ?)",
+        (path, size, mtime_ns, tail_hash(path, size)))
+
+
+def refresh(db, paths, workers=None, chunk_size=DEFAULT_CHUNK_MB << 20,
+            remove_missing=False):
+    ranges, forget, seen, stats = plan(db, expand_inputs(paths), remove_missing)
+
+    chunks = []
+    for path, start, end in ranges:
+        if is_compressed(path):
+            chunks.append((path, start, end))
+        else:
+            chunks.extend(split_range(path, start, end, chunk_size))
+    stats['bytes_mapped'] = sum(end - start for _, start, end in chunks)
+
+    # staging opens the transaction (on the temporary table only); all of it
+    # is applied together below, so a failed run leaves the old state
+    with db:
+        db.execute("DELETE FROM delta")
+        if chunks:
+            with Pool(workers or os.cpu_count() or 1) as pool:
+                for path, counts in pool.imap_unordered(count_range, chunks):
+                    stage_delta(db, path, counts)
+
+        for path in forget:
+            forget_file(db, path)
+        apply_delta(db)
+        for path, _, _ in ranges:
+            record_file(db, path, *seen[path])
+    return stats
+
+
+def write_counts(db, out):
+    job = MRUniqueWordCount(args=[])
+    write = job.output_protocol().write
+    rows = sorted(((sort_key(job, word), word, count) for word, count in
+                   db.execute("SELECT word, count FROM counts")),
+                  key=lambda row: row[0])
+    for _, word, count in rows:
+        out.write(write(word, count) + b'\n')
+    out.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('paths', nargs='+', help='input files or directories')
+    parser.add_argument('--state', required=True,
+                        help='SQLite file holding the counts and manifest')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (default: all cores)')
+    parser.add_argument('--chunk-mb', type=int, default=DEFAULT_CHUNK_MB,
+                        help='size of one map task in MB (default: %(default)s)')
+    parser.add_argument('--output', default=None,
+                        help='write the counts here instead of stdout')
+    parser.add_argument('--remove-missing', action='store_true',
+                        help='subtract the counts of files in the state that '
+                             'are not among the inputs')
+    args = parser.parse_args()
+
+    db = open_state(args.state)
+    try:
+        stats = refresh(db, args.paths, args.workers, args.chunk_mb << 20,
+                        args.remove_missing)
+        print("new: %(new)d, appended: %(appended)d, changed: %(changed)d, "
+              "removed: %(removed)d, not given: %(not_given)d, "
+              "unchanged: %(unchanged)d, bytes mapped: %(bytes_mapped)d" % stats,
+              file=sys.stderr)
+
+        if args.output:
+            with open(args.output, 'wb') as out:
+                write_counts(db, out)
+        else:
+            write_counts(db, sys.stdout.buffer)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Count MRUniqueWordCount's words straight out of a memory-mapped file.
+
+The mapper lowercases every line and runs re.findall(r'\\b\\w+\\b') over it,
+which allocates a string per line, a string per word and a list per line.
+Here the file is mmapped and scanned with a bytes regex for runs of ASCII word
+bytes and non-ASCII bytes. Runs are counted as raw bytes and are only
+lowercased and decoded once per distinct run, at the end. Runs that contain
+non-ASCII bytes are decoded and re-tokenized with the mapper's own regex, so
+the counts are the same as the mapper's.
+
+mrjob decodes a line that is not valid UTF-8 as latin-1, the whole line. A
+multi-byte sequence never spans two runs, so such a line is one with a run
+that is not valid UTF-8. When a buffer has one, the lines with non-ASCII
+bytes are checked one by one, and each invalid one is taken out of the run
+counts and tokenized whole, as the mapper would.
+"""
+import mmap
+import re
+from collections import Counter
+
+# the regex MRUniqueWordCount.mapper uses
+WORD_RE = re.compile(r'\b\w+\b')
+
+# ASCII word characters, plus every byte that can be part of a UTF-8 sequence
+RUN_RE = re.compile(rb'[0-9A-Za-z_\x80-\xff]+')
+
+NON_ASCII_RE = re.compile(rb'[\x80-\xff]')
+
+# bytes scanned per findall() call; bounds the size of the token list
+WINDOW_SIZE = 1 << 20
+
+
+def count_runs(buf, start=0, end=None, window_size=WINDOW_SIZE):
+    # Count raw byte runs in buf[start:end] without copying the buffer
+    if end is None:
+        end = len(buf)
+    runs = Counter()
+    pos = start
+    while pos < end:
+        stop = min(pos + window_size, end)
+        # don't cut a run in half at the window edge
+        m = RUN_RE.match(buf, stop, end)
+        if m:
+            stop = m.end()
+        runs.update(RUN_RE.findall(buf, pos, stop))
+        pos = stop
+    return runs
+
+
+def decode_run(run):
+    try:
+        return run.decode('utf_8')
+    except UnicodeDecodeError:
+        return run.decode('latin_1')
+
+
+def has_invalid_utf8(runs):
+    for run in runs:
+        if not run.isascii():
+            try:
+                run.decode('utf_8')
+            except UnicodeDecodeError:
+                return True
+    return False
+
+
+def count_latin_1_lines(buf, start, end, runs):
+    # Move the lines of buf[start:end] that are not valid UTF-8 out of runs
+    # and return their words, decoded as latin-1 the way mrjob decodes them.
+    # Only lines with a non-ASCII byte are looked at.
+    words = Counter()
+    pos = start
+    while True:
+        m = NON_ASCII_RE.search(buf, pos, end)
+        if m is None:
+            return words
+        line_start = max(start, buf.rfind(b'\n', start, m.start()) + 1)
+        line_end = buf.find(b'\n', m.end(), end)
+        line_end = end if line_end < 0 else line_end + 1
+        line = buf[line_start:line_end]
+        try:
+            line.decode('utf_8')
+        except UnicodeDecodeError:
+            runs.subtract(RUN_RE.findall(line))
+            words.update(WORD_RE.findall(line.decode('latin_1').lower()))
+        pos = line_end
+
+
+def decode_counts(runs, words=None):
+    # Turn raw run counts into the mapper's lowercased word counts
+    words = Counter() if words is None else words
+    for run, count in runs.items():
+        if not count:
+            # every occurrence was in a line counted as latin-1
+            continue
+        if run.isascii():
+            words[run.lower().decode('ascii')] += count
+        else:
+            for word in WORD_RE.findall(decode_run(run).lower()):
+                words[word] += count
+    return words
+
+
+def count_blocks(blocks):
+    # Word counts for an iterable of buffers that each end outside a word,
+    # e.g. line-aligned blocks from a decompressor
+    runs = Counter()
+    words = Counter()
+    for block in blocks:
+        block_runs = count_runs(block)
+        if has_invalid_utf8(block_runs):
+            words.update(count_latin_1_lines(block, 0, len(block), block_runs))
+        runs.update(block_runs)
+    return decode_counts(runs, words)
+
+
+def count_file(path, start=0, end=None):
+    # Word counts for the byte range [start, end) of path, which must begin
+    # and end on line boundaries (or at least outside a word)
+    with open(path, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be mapped
+            return Counter()
+    try:
+        if hasattr(buf, 'madvise'):
+            buf.madvise(mmap.MADV_SEQUENTIAL)
+        if end is None:
+            end = len(buf)
+        runs = count_runs(buf, start, end)
+        words = None
+        if has_invalid_utf8(runs):
+            words = count_latin_1_lines(buf, start, end, runs)
+        return decode_counts(runs, words)
+    finally:
+        buf.close()
@@ -0,0 +1,399 @@
+"""Run MRUniqueWordCount on all local cores without going through mrjob's runners.
+
+Usage:
+    python native_runner.py input_file_or_dir [...] [--workers N] [--chunk-mb M]
+                            [--mmap] [-- job options, e.g. --combine-buffer-mb 16]
+
+Input files are cut into byte ranges on line boundaries. Each range is one map
+task (mapper + combiner) in a multiprocessing pool; map output is hash
+partitioned into sorted spill files, which are then reduced in parallel. Each
+reducer streams its spill files and writes its output, still sorted, to a
+file of its own; the parent stream-merges those files into the same sorted
+output the inline runner prints. Neither side holds a whole partition in
+memory. Jobs with several steps (such as --top-k) feed each step's reduce
+output files into the next step's map tasks.
+
+Directories are read recursively. Compressed shards (.gz, .bz2, .zst) can't
+be split, so each one is a map task of its own, decompressed by a read-ahead
+thread while the task tokenizes (see compressed_input.py); shards are
+processed concurrently across the pool.
+
+With --mmap, map tasks skip the job's mapper and count words straight from a
+memory-mapped view of the input (see mmap_tokenizer.py).
+"""
+import argparse
+import heapq
+import io
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import zlib
+from itertools import islice
+from multiprocessing import Pool
+
+from mrjob.parse import parse_mr_job_stderr
+
+from MapReduce import MRUniqueWordCount
+from compressed_input import is_compressed, iter_line_blocks, iter_lines
+from mmap_tokenizer import count_blocks, count_file
+
+DEFAULT_CHUNK_MB = 64
+
+# collapse a key's buffered values through the combiner once this many pile up
+COMBINE_EVERY = 256
+
+# records per pickle in spill and reduce output files; readers hold one
+# block per file at a time
+BLOCK_RECORDS = 10000
+
+
+def expand_inputs(paths):
+    # Files as given, directories walked recursively (hidden files skipped)
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+                files.extend(os.path.join(root, name) for name in sorted(names)
+                             if not name.startswith('.'))
+        else:
+            files.append(path)
+    return files
+
+
+def split_input(paths, chunk_size):
+    # Cut every file into (path, start, end) ranges that begin on a line start
+    chunks = []
+    for path in expand_inputs(paths):
+        size = os.path.getsize(path)
+        if is_compressed(path):
+            # compressed shards are read whole by a single task
+            chunks.append((path, 0, size))
+        else:
+            chunks.extend(split_range(path, 0, size, chunk_size))
+    # biggest tasks first so a large shard doesn't start last
+    chunks.sort(key=lambda chunk: chunk[2] - chunk[1], reverse=True)
+    return chunks
+
+
+def split_range(path, start, end, chunk_size):
+    # Cut [start, end) of one file into ranges; start must be a line start
+    chunks = []
+    with open(path, 'rb') as f:
+        while start < end:
+            stop = start + chunk_size
+            if stop < end:
+                f.seek(stop)
+                f.readline()
+                stop = min(f.tell(), end)
+            else:
+                stop = end
+            chunks.append((path, start, stop))
+            start = stop
+    return chunks
+
+
+def read_lines(path, start, end):
+    if is_compressed(path):
+        yield from iter_lines(path)
+        return
+    with open(path, 'rb') as f:
+        f.seek(start)
+        pos = start
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            yield line
+
+
+def split_job_args(argv):
+    # (the script's own arguments, the job's): everything after "--" is
+    # passed through to the job
+    if '--' not in argv:
+        return list(argv), []
+    split = argv.index('--')
+    return argv[:split], argv[split + 1:]
+
+
+def native_command(command, job_args):
+    # command plus job_args, behind the "--" split_job_args looks for
+    return list(command) + (['--'] + list(job_args) if job_args else [])
+
+
+def make_job(job_class, job_args):
+    # sandboxed so counters land in a buffer we can hand back to the parent
+    return job_class(args=list(job_args)).sandbox(stderr=io.BytesIO())
+
+
+def job_counters(job):
+    return parse_mr_job_stderr(job.stderr.getvalue())['counters']
+
+
+def add_counters(total, counters):
+    for group, group_counters in counters.items():
+        for counter, amount in group_counters.items():
+            total.setdefault(group, {}).setdefault(counter, 0)
+            total[group][counter] += amount
+
+
+def format_counters(counters):
+    # same layout as the "Counters:" block mrjob prints when a job finishes
+    lines = ['Counters: %d' % sum(len(c) for c in counters.values())]
+    for group, group_counters in sorted(counters.items()):
+        lines.append('\t%s' % group)
+        for counter, amount in sorted(group_counters.items()):
+            lines.append('\t\t%s=%d' % (counter, amount))
+    return '\n'.join(lines)
+
+
+def count_chunk(path, start, end):
+    # Word counts for one chunk without running the mapper
+    if is_compressed(path):
+        return count_blocks(iter_line_blocks(path))
+    return count_file(path, start, end)
+
+
+def sort_key(job, key):
+    # mrjob sorts reducer input by the encoded key, so we do the same
+    return job.internal_protocol().write(key, None).split(b'\t')[0]
+
+
+def first(record):
+    return record[0]
+
+
+def partition_of(encoded_key, num_partitions):
+    # crc32 instead of hash(): str hashes differ between worker processes
+    return zlib.crc32(encoded_key) % num_partitions
+
+
+def write_blocks(path, records):
+    # Pickle an iterator of records to path, BLOCK_RECORDS at a time
+    with open(path, 'wb') as f:
+        while True:
+            block = list(islice(records, BLOCK_RECORDS))
+            if not block:
+                break
+            pickle.dump(block, f, pickle.HIGHEST_PROTOCOL)
+
+
+def read_blocks(path):
+    # The records of a write_blocks file, one block in memory at a time
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            yield from block
+
+
+def run_map_task(job_class, job_args, step_num, source, num_partitions, work_dir,
+                 task_num, use_mmap=False):
+    # source is a (path, start, end) chunk for the first step and the output
+    # file of a reduce partition for later steps
+    job = make_job(job_class, job_args)
+    if use_mmap:
+        # the counts are already combined, so go straight to the spill files
+        records = sorted(((sort_key(job, word), word, [count])
+                          for word, count in count_chunk(*source).items()),
+                         key=first)
+        return write_spills(records, num_partitions, work_dir, task_num, job)
+
+    step = job.steps()[step_num]
+    combiner = step['combiner']
+
+    if step_num == 0:
+        read = job.input_protocol().read
+        pairs = (read(line.rstrip(b'\r\n')) for line in read_lines(*source))
+    else:
+        pairs = (pair for _, pair in read_blocks(source))
+
+    # Buffer map output per key (keys must be hashable, as words are)
+    groups = {}
+    for key, value in job.map_pairs(pairs, step_num):
+        values = groups.get(key)
+        if values is None:
+            groups[key] = [value]
+            continue
+        values.append(value)
+        # Hadoop may run a combiner any number of times, so fold early to
+        # keep the buffer small
+        if combiner and len(values) >= COMBINE_EVERY:
+            groups[key] = [v for _, v in combiner(key, iter(values))]
+
+    records = sorted(((sort_key(job, key), key, values)
+                      for key, values in groups.items()), key=first)
+    del groups
+
+    if combiner:
+        combined = job.combine_pairs(
+            (key, value) for _, key, values in records for value in values)
+        records = sorted(((sort_key(job, key), key, [value])
+                          for key, value in combined), key=first)
+
+    return write_spills(records, num_partitions, work_dir, task_num, job)
+
+
+def write_spills(records, num_partitions, work_dir, task_num, job):
+    # Write one sorted spill file per reduce partition; returns the spill
+    # paths and the task's counters
+    partitions = [[] for _ in range(num_partitions)]
+    num_records = 0
+    for encoded, key, values in records:
+        part = partitions[partition_of(encoded, num_partitions)]
+        for value in values:
+            part.append((encoded, key, value))
+        num_records += len(values)
+    job.increment_counter('native_runner', 'records_shuffled', num_records)
+
+    paths = []
+    for part_num, part in enumerate(partitions):
+        path = os.path.join(work_dir, 'map-%s-part-%05d' % (task_num, part_num))
+        write_blocks(path, iter(part))
+        paths.append(path)
+    return paths, job_counters(job)
+
+
+def run_reduce_task(job_class, job_args, step_num, spill_paths, last_step, out_path):
+    # Reduce one partition into out_path; returns it and the task's counters
+    job = make_job(job_class, job_args)
+    write_blocks(out_path, reduce_records(job, step_num, spill_paths, last_step))
+    return out_path, job_counters(job)
+
+
+def reduce_records(job, step_num, spill_paths, last_step):
+    step = job.steps()[step_num]
+    reducer = step['reducer']
+
+    # the last step returns encoded output lines, earlier ones the raw pairs
+    # that feed the next step
+    if last_step:
+        write = job.output_protocol().write
+    else:
+        write = lambda k, v: (k, v)
+
+    merged = heapq.merge(*(read_blocks(path) for path in spill_paths),
+                         key=first)
+
+    # Tag every output record with the key that produced it so the parent can
+    # merge all partitions' files back into a single sorted stream
+    if step['reducer_init']:
+        for k, v in step['reducer_init']() or ():
+            yield b'', write(k, v)
+
+    group_key = None
+    group_values = []
+    for encoded, key, value in merged:
+        if group_values and encoded != group_key:
+            for k, v in reducer(group_values[0][0],
+                                (v for _, v in group_values)) or ():
+                yield group_key, write(k, v)
+            group_values = []
+        group_key = encoded
+        group_values.append((key, value))
+    if group_values:
+        for k, v in reducer(group_values[0][0],
+                            (v for _, v in group_values)) or ():
+            yield group_key, write(k, v)
+
+    if step['reducer_final']:
+        for k, v in step['reducer_final']() or ():
+            yield b'\xff', write(k, v)
+
+
+def _map_star(args):
+    return run_map_task(*args)
+
+
+def _reduce_star(args):
+    return run_reduce_task(*args)
+
+
+def run_native(job_class, paths, workers=None, chunk_size=DEFAULT_CHUNK_MB << 20,
+               job_args=(), out=None, use_mmap=False):
+    workers = workers or os.cpu_count() or 1
+    out = out or sys.stdout.buffer
+    num_steps = len(make_job(job_class, job_args).steps())
+
+    counters = {}
+
+    work_dir = tempfile.mkdtemp(prefix='native_runner-')
+    try:
+        sources = split_input(paths, chunk_size)
+        with Pool(workers) as pool:
+            for step_num in range(num_steps):
+                last_step = step_num == num_steps - 1
+                map_tasks = [(job_class, job_args, step_num, source, workers,
+                              work_dir, '%d-%d' % (step_num, task_num),
+                              use_mmap and step_num == 0)
+                             for task_num, source in enumerate(sources)]
+                spills = []
+                for task_spills, task_counters in pool.map(
+                        _map_star, map_tasks, chunksize=1):
+                    spills.append(task_spills)
+                    add_counters(counters, task_counters)
+
+                reduce_tasks = [(job_class, job_args, step_num,
+                                 [task[part] for task in spills], last_step,
+                                 os.path.join(work_dir, 'reduce-%d-part-%05d'
+                                              % (step_num, part)))
+                                for part in range(workers)]
+                reduced = []
+                for path, task_counters in pool.map(
+                        _reduce_star, reduce_tasks, chunksize=1):
+                    reduced.append(path)
+                    add_counters(counters, task_counters)
+
+                if not last_step:
+                    sources = reduced
+
+        # stream the reducers' sorted output files into one sorted output
+        for _, line in heapq.merge(*(read_blocks(path) for path in reduced),
+                                   key=first):
+            out.write(line + b'\n')
+        out.flush()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if counters:
+        print(format_counters(counters), file=sys.stderr)
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('paths', nargs='+', help='input files')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (default: all cores)')
+    parser.add_argument('--chunk-mb', type=int, default=DEFAULT_CHUNK_MB,
+                        help='size of one map task in MB (default: %(default)s)')
+    parser.add_argument('--mmap', action='store_true',
+                        help='tokenize from a memory-mapped view of the input '
+                             'instead of running the mapper line by line')
+    argv, job_args = split_job_args(sys.argv[1:])
+    args = parser.parse_args(argv)
+    try:
+        job = make_job(MRUniqueWordCount, job_args)
+    except ValueError as error:
+        # the job's own parser reports bad options this way when it isn't
+        # reading sys.argv
+        parser.error('job options: %s' % error)
+    if args.mmap:
+        if job.options.approx:
+            parser.error('--mmap counts words exactly and cannot be used '
+                         'with --approx')
+        if not job.default_tokenizer():
+            parser.error('--mmap only supports the default word tokenizer')
+
+    run_native(MRUniqueWordCount, args.paths, workers=args.workers,
+               chunk_size=args.chunk_mb << 20, job_args=job_args,
+               use_mmap=args.mmap)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Check that spilled in-mapper runs give the same counts as the buffer.
+
+Usage:
+    python spill_check.py [input.txt ...] [-- job options]
+
+Runs MRUniqueWordCount inline twice on the inputs: once with the default
+--combine-buffer-mb, and once with --combine-buffer-mb 0, which spills a run
+after every token. Both outputs are compared. Without inputs, it uses a
+small file whose comma-separated tokens (with --token-pattern '[^,]+')
+contain tabs, quotes, backslashes and non-ASCII characters.
+"""
+import os
+import sys
+import tempfile
+
+from MapReduce import MRUniqueWordCount
+from native_runner import split_job_args
+
+SAMPLE_LINES = [
+    'a\tb,c,"quoted",back\\slash',
+    'a\tb,ünïcödé,c',
+    ' leading space,trailing tab\t,c',
+]
+
+SAMPLE_ARGS = ['--token-pattern', '[^,]+', '--keep-case']
+
+
+def run_job(paths, job_args):
+    job = MRUniqueWordCount(args=['-r', 'inline', '--no-conf'] + job_args + paths)
+    with job.make_runner() as runner:
+        runner.run()
+        return dict(job.parse_output(runner.cat_output()))
+
+
+def main():
+    argv, job_args = split_job_args(sys.argv[1:])
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = argv
+        if not paths:
+            path = os.path.join(directory, 'sample.txt')
+            with open(path, 'w', encoding='utf_8') as f:
+                f.write('\n'.join(SAMPLE_LINES) + '\n')
+            paths = [path]
+            job_args = SAMPLE_ARGS + job_args
+
+        buffered = run_job(paths, job_args)
+        spilled = run_job(paths, job_args + ['--combine-buffer-mb', '0'])
+
+    if buffered != spilled:
+        for word in sorted(set(buffered) | set(spilled), key=repr):
+            if buffered.get(word) != spilled.get(word):
+                print('%r: buffered %s, spilled %s' % (
+                    word, buffered.get(word), spilled.get(word)))
+        sys.exit(1)
+    print('%d words, same counts with and without spilling' % len(buffered))
+
+
+if __name__ == '__main__':
+    main()
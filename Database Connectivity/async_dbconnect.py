@@ -0,0 +1,87 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import dbconnect
+from connection_pool import mysql_pool
+
+
+class AsyncPool:
+    # Runs blocking DB-API calls from asyncio code. Calls are offloaded to a
+    # small thread pool, one thread per pooled connection, and a semaphore
+    # keeps any number of waiting coroutines from queueing up more work than
+    # there are connections. Hundreds of concurrent lookups therefore share
+    # `max_concurrency` threads instead of needing one thread each.
+
+    def __init__(self, pool, max_concurrency=None):
+        self.pool = pool
+        self.max_concurrency = max_concurrency or pool.size
+        self.semaphore = asyncio.BoundedSemaphore(self.max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                           thread_name_prefix="db")
+
+    async def run(self, func, *args):
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.executor.shutdown)
+        self.pool.close()
+
+
+def _fetch_users(pool, columns):
+    return list(dbconnect.iter_users(pool, columns))
+
+
+async def create_table(apool):
+    await apool.run(dbconnect.create_table, apool.pool)
+
+
+async def insert_data(apool, username, email):
+    await apool.run(dbconnect.insert_data, apool.pool, username, email)
+
+
+async def bulk_insert(apool, users, batch_size=1000):
+    return await apool.run(dbconnect.bulk_insert, apool.pool, users, batch_size)
+
+
+async def fetch_data(apool):
+    await apool.run(dbconnect.fetch_data, apool.pool)
+
+
+async def fetch_users(apool, columns=None):
+    # All rows as a list; use for small tables, scan in pages otherwise
+    return await apool.run(_fetch_users, apool.pool, columns)
+
+
+async def get_user(apool, user_id):
+    return await apool.run(dbconnect.get_user, apool.pool, "id", user_id)
+
+
+async def get_users(apool, user_ids):
+    # Look up many users concurrently; results come back in user_ids order
+    return await asyncio.gather(*(get_user(apool, user_id) for user_id in user_ids))
+
+
+async def main():
+    apool = AsyncPool(mysql_pool(
+        size=10,
+        host="your_host",
+        user="your_username",
+        password="your_password",
+        database="your_database"
+    ))
+    try:
+        await create_table(apool)
+        await asyncio.gather(
+            insert_data(apool, "john_doe", "john@example.com"),
+            insert_data(apool, "jane_doe", "jane@example.com"),
+        )
+        await fetch_data(apool)
+    finally:
+        await apool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
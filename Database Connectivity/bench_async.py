@@ -0,0 +1,94 @@
+"""Lookup throughput of the sync dbconnect path against async_dbconnect.
+
+Usage:
+    python bench_async.py [--lookups 2000] [--concurrency 16] [--latency-ms 1.0]
+
+Runs against a SQLite stand-in. A local SQLite query has no network round
+trip, which is exactly what async access hides, so every statement is delayed
+by --latency-ms to stand in for one (use 0 to measure the raw overhead).
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import time
+
+from async_dbconnect import AsyncPool, get_users
+from connection_pool import ConnectionPool
+from dbconnect import bulk_insert, create_table
+
+
+def latency_pool(path, size, latency):
+    class SlowCursor(sqlite3.Cursor):
+        def execute(self, *args):
+            time.sleep(latency)
+            return super().execute(*args)
+
+    class SlowConnection(sqlite3.Connection):
+        def cursor(self, factory=SlowCursor):
+            return super().cursor(factory)
+
+    def connect():
+        return sqlite3.connect(path, check_same_thread=False, timeout=30,
+                               factory=SlowConnection)
+
+    return ConnectionPool(connect, size=size, dialect="sqlite", placeholder="?",
+                          error=sqlite3.Error)
+
+
+def sync_lookups(pool, user_ids):
+    query = "SELECT id, username, email FROM users WHERE id = ?"
+    rows = []
+    for user_id in user_ids:
+        with pool.cursor() as cursor:
+            cursor.execute(query, (user_id,))
+            rows.append(cursor.fetchone())
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="pooled connections / concurrent queries for the async run")
+    parser.add_argument("--latency-ms", type=float, default=1.0)
+    parser.add_argument("--db", default="bench_async.db")
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    setup = latency_pool(args.db, 1, 0)
+    create_table(setup)
+    bulk_insert(setup, (("user%d" % i, "user%d@example.com" % i) for i in range(args.users)))
+    setup.close()
+
+    user_ids = [random.randint(1, args.users) for _ in range(args.lookups)]
+    latency = args.latency_ms / 1000.0
+
+    pool = latency_pool(args.db, 1, latency)
+    start = time.perf_counter()
+    expected = sync_lookups(pool, user_ids)
+    sync_time = time.perf_counter() - start
+    pool.close()
+
+    async def run_async():
+        apool = AsyncPool(latency_pool(args.db, args.concurrency, latency))
+        try:
+            return await get_users(apool, user_ids)
+        finally:
+            await apool.close()
+
+    start = time.perf_counter()
+    rows = asyncio.run(run_async())
+    async_time = time.perf_counter() - start
+    assert rows == expected
+
+    print("sync:  %8.0f lookups/sec" % (args.lookups / sync_time))
+    print("async: %8.0f lookups/sec (%d concurrent, %.1fx)" % (
+        args.lookups / async_time, args.concurrency, sync_time / async_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Compare row-by-row inserts with dbconnect.bulk_insert on a SQLite stand-in.
+
+Usage:
+    python bench_bulk_insert.py [--rows 1000000] [--batch-size 1000] [--db bench_bulk.db]
+
+Users are produced by a generator, so the peak traced memory of each run
+shows how much the loader itself holds on to.
+"""
+import argparse
+import os
+import time
+import tracemalloc
+
+from connection_pool import sqlite_pool
+from dbconnect import bulk_insert, create_table
+
+
+def generate_users(rows):
+    for i in range(rows):
+        yield "user%d" % i, "user%d@example.com" % i
+
+
+def fresh_pool(path):
+    if os.path.exists(path):
+        os.remove(path)
+    pool = sqlite_pool(path, size=1)
+    create_table(pool)
+    return pool
+
+
+def row_by_row(pool, users):
+    # what calling insert_data in a loop costs, minus its print per row
+    query = "INSERT INTO users (username, email) VALUES (?, ?)"
+    count = 0
+    for user in users:
+        with pool.cursor() as cursor:
+            cursor.execute(query, user)
+        count += 1
+    return count
+
+
+def measure(name, run):
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = run()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("%-22s %9d rows %8.2f s %10.0f rows/sec   peak %7.1f KB" % (
+        name, rows, elapsed, rows / elapsed, peak / 1024.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--row-by-row-rows", type=int, default=20000,
+                        help="rows for the (slow) row-by-row run")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--db", default="bench_bulk.db")
+    args = parser.parse_args()
+
+    pool = fresh_pool(args.db)
+    measure("row by row", lambda: row_by_row(pool, generate_users(args.row_by_row_rows)))
+    pool.close()
+
+    for multi_row, name in ((False, "bulk executemany"), (True, "bulk multi-row VALUES")):
+        pool = fresh_pool(args.db)
+        measure(name, lambda: bulk_insert(pool, generate_users(args.rows),
+                                          batch_size=args.batch_size,
+                                          multi_row=multi_row))
+        pool.close()
+
+    # memory should not grow with the input size
+    for rows in (args.rows // 10, args.rows):
+        pool = fresh_pool(args.db)
+        measure("multi-row, %d rows" % rows,
+                lambda: bulk_insert(pool, generate_users(rows), batch_size=args.batch_size))
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
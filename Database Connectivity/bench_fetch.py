@@ -0,0 +1,60 @@
+"""Client memory of fetchall() against the streaming fetch APIs in dbconnect.
+
+Usage:
+    python bench_fetch.py [--rows 1000000] [--db bench_fetch.db]
+"""
+import argparse
+import os
+import time
+import tracemalloc
+
+from connection_pool import sqlite_pool
+from dbconnect import bulk_insert, create_table, iter_users, scan_users
+
+
+def fetch_all(pool):
+    with pool.cursor() as cursor:
+        cursor.execute("SELECT * FROM users")
+        return len(cursor.fetchall())
+
+
+def count(rows):
+    total = 0
+    for _ in rows:
+        total += 1
+    return total
+
+
+def measure(name, run):
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = run()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("%-28s %9d rows %7.2f s   peak %10.1f KB" % (name, rows, elapsed, peak / 1024.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--db", default="bench_fetch.db")
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    pool = sqlite_pool(args.db, size=1)
+    create_table(pool)
+    bulk_insert(pool, (("user%d" % i, "user%d@example.com" % i) for i in range(args.rows)))
+
+    measure("fetchall", lambda: fetch_all(pool))
+    measure("iter_users", lambda: count(iter_users(pool, batch_size=args.batch_size)))
+    measure("scan_users (keyset)", lambda: count(scan_users(pool, batch_size=args.batch_size)))
+    measure("scan_users, email only", lambda: count(
+        scan_users(pool, columns=["email"], batch_size=args.batch_size)))
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Lookup latency by username and email before and after create_indexes.
+
+Usage:
+    python bench_indexes.py [--rows 1000000] [--ops 200] [--db bench_indexes.db]
+
+The table is filled with --rows users, then --ops random lookups by username
+and by email are timed twice: once against the bare table (every lookup is a
+full scan) and once after the indexes in dbconnect.USER_INDEXES are created.
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+from connection_pool import sqlite_pool
+from dbconnect import bulk_insert, create_indexes, create_table, explain_queries, get_user
+
+
+def time_lookups(pool, column, values):
+    latencies = []
+    for value in values:
+        start = time.perf_counter()
+        get_user(pool, column, value)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    print("%-28s mean %10.1f us   p50 %10.1f us   p99 %10.1f us" % (
+        name,
+        statistics.mean(latencies) * 1e6,
+        latencies[len(latencies) // 2] * 1e6,
+        latencies[int(len(latencies) * 0.99)] * 1e6))
+    return statistics.mean(latencies)
+
+
+def run(pool, label, lookups):
+    return {column: report("%s, by %s" % (label, column), time_lookups(pool, column, values))
+            for column, values in lookups.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--ops", type=int, default=200)
+    parser.add_argument("--db", default="bench_indexes.db")
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    pool = sqlite_pool(args.db, size=1)
+    create_table(pool)
+    bulk_insert(pool, (("user%d" % i, "user%d@example.com" % i) for i in range(args.rows)))
+    ids = [random.randrange(args.rows) for _ in range(args.ops)]
+    lookups = {
+        "username": ["user%d" % i for i in ids],
+        "email": ["user%d@example.com" % i for i in ids],
+    }
+
+    print()
+    explain_queries(pool)
+    before = run(pool, "no index", lookups)
+
+    print()
+    start = time.perf_counter()
+    create_indexes(pool)
+    print("indexes built in %.2f s" % (time.perf_counter() - start))
+    # a second run has nothing left to do
+    assert create_indexes(pool) == []
+    explain_queries(pool)
+    after = run(pool, "indexed", lookups)
+
+    print()
+    for column in lookups:
+        print("by %-8s %.0fx faster" % (column, before[column] / after[column]))
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Per-operation latency with and without the connection pool.
+
+Usage:
+    python bench_pool.py [--ops 2000] [--db bench_pool.db]
+    python bench_pool.py --mysql-host HOST --mysql-user USER --mysql-password PW --mysql-database DB
+
+Each operation looks up one user by id. The "reconnect" run opens and closes
+a connection per operation, like running dbconnect.py once per request; the
+"pooled" run checks a connection out of a ConnectionPool instead.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import time
+
+from connection_pool import mysql_pool, sqlite_pool
+from dbconnect import create_table
+
+
+def lookup(cursor, placeholder, user_id):
+    cursor.execute("SELECT id, username, email FROM users WHERE id = {0}".format(placeholder),
+                   (user_id,))
+    return cursor.fetchall()
+
+
+def time_ops(ops, op):
+    latencies = []
+    for i in range(ops):
+        start = time.perf_counter()
+        op(i)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    print("%-10s mean %8.1f us   p50 %8.1f us   p99 %8.1f us" % (
+        name,
+        statistics.mean(latencies) * 1e6,
+        latencies[len(latencies) // 2] * 1e6,
+        latencies[int(len(latencies) * 0.99)] * 1e6))
+    return statistics.mean(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--db", default="bench_pool.db",
+                        help="SQLite file used when no MySQL server is given")
+    parser.add_argument("--mysql-host")
+    parser.add_argument("--mysql-user")
+    parser.add_argument("--mysql-password")
+    parser.add_argument("--mysql-database")
+    args = parser.parse_args()
+
+    if args.mysql_host:
+        import mysql.connector
+
+        config = dict(host=args.mysql_host, user=args.mysql_user,
+                      password=args.mysql_password, database=args.mysql_database)
+        pool = mysql_pool(size=1, **config)
+        connect = lambda: mysql.connector.connect(**config)
+    else:
+        if os.path.exists(args.db):
+            os.remove(args.db)
+        pool = sqlite_pool(args.db, size=1)
+        connect = lambda: sqlite3.connect(args.db)
+
+    create_table(pool)
+    with pool.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO users (username, email) VALUES ({0}, {0})".format(pool.placeholder),
+            [("user%d" % i, "user%d@example.com" % i) for i in range(args.users)])
+    ids = [random.randint(1, args.users) for _ in range(args.ops)]
+
+    def reconnect_op(i):
+        connection = connect()
+        cursor = connection.cursor()
+        lookup(cursor, pool.placeholder, ids[i])
+        cursor.close()
+        connection.close()
+
+    def pooled_op(i):
+        with pool.cursor() as cursor:
+            lookup(cursor, pool.placeholder, ids[i])
+
+    print()
+    reconnect = report("reconnect", time_ops(args.ops, reconnect_op))
+    pooled = report("pooled", time_ops(args.ops, pooled_op))
+    print("saved %.1f us per operation (%.1fx faster)" % (
+        (reconnect - pooled) * 1e6, reconnect / pooled))
+    print("pool stats:", pool.stats)
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
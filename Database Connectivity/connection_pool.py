@@ -0,0 +1,239 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Cursor options that make the server prepare a statement once and reuse it.
+# sqlite3 already keeps a per-connection cache of compiled statements, keyed
+# by SQL text, so a plain cursor per statement is enough there.
+PREPARED_CURSOR_OPTIONS = {
+    'mysql': {'prepared': True},
+}
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    # A small thread-safe pool around any DB-API connect() function.
+    #
+    # size                  most connections open at once
+    # max_idle              seconds an unused connection is kept before eviction
+    # health_check_interval seconds after which a connection is pinged before
+    #                       it is handed out again
+    # timeout               seconds to wait for a free connection
+    # max_statements        most prepared statements kept per connection
+
+    def __init__(self, connect, size=5, max_idle=300, health_check_interval=30,
+                 timeout=30, dialect='mysql', placeholder='%s', error=Exception,
+                 max_statements=64):
+        self._connect = connect
+        self.size = size
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.dialect = dialect
+        self.placeholder = placeholder
+        self.Error = error
+        self.max_statements = max_statements
+
+        self._lock = threading.Condition()
+        # (connection, cursor, last_used, last_checked), most recent last
+        self._idle = []
+        self._open = 0
+        self._closed = False
+        # id(connection) -> {sql: prepared cursor}, least recently used first
+        self._statements = {}
+        self.stats = {'created': 0, 'reused': 0, 'evicted': 0,
+                      'failed_health_checks': 0, 'discarded': 0,
+                      'statements_prepared': 0, 'statements_reused': 0}
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _new(self):
+        connection = self._connect()
+        with self._lock:
+            self.stats['created'] += 1
+            self._statements[id(connection)] = OrderedDict()
+        now = time.monotonic()
+        return connection, connection.cursor(), now, now
+
+    def _healthy(self, cursor):
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            return True
+        except Exception:
+            return False
+
+    def _close(self, entry):
+        connection, cursor = entry[:2]
+        with self._lock:
+            statements = self._statements.pop(id(connection), {})
+        try:
+            for prepared in statements.values():
+                prepared.close()
+            cursor.close()
+            connection.close()
+        except Exception:
+            pass
+
+    def prepared_cursor(self, connection, sql):
+        # A cursor for sql on a checked-out connection. The first call for a
+        # given SQL text prepares it; later calls, from any checkout of the
+        # same connection, get the same cursor back.
+        statements = self._statements[id(connection)]
+        cursor = statements.get(sql)
+        if cursor is not None:
+            statements.move_to_end(sql)
+            self._count('statements_reused')
+            return cursor
+        cursor = connection.cursor(**PREPARED_CURSOR_OPTIONS.get(self.dialect, {}))
+        statements[sql] = cursor
+        self._count('statements_prepared')
+        if len(statements) > self.max_statements:
+            _, oldest = statements.popitem(last=False)
+            oldest.close()
+        return cursor
+
+    def evict_idle(self):
+        # Close connections that have sat unused for longer than max_idle
+        now = time.monotonic()
+        with self._lock:
+            keep = []
+            for entry in self._idle:
+                if now - entry[2] > self.max_idle:
+                    self._close(entry)
+                    self._open -= 1
+                    self.stats['evicted'] += 1
+                else:
+                    keep.append(entry)
+            self._idle = keep
+            self._lock.notify_all()
+
+    def _checkout(self):
+        self.evict_idle()
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("pool is closed")
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    entry = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout("no free connection after %s seconds"
+                                      % self.timeout)
+                self._lock.wait(remaining)
+
+        if entry is None:
+            try:
+                return self._new()
+            except Exception:
+                self._release_slot()
+                raise
+
+        now = time.monotonic()
+        if now - entry[3] > self.health_check_interval:
+            if not self._healthy(entry[1]):
+                self._count('failed_health_checks')
+                self._close(entry)
+                try:
+                    return self._new()
+                except Exception:
+                    self._release_slot()
+                    raise
+            entry = entry[:3] + (now,)
+        self._count('reused')
+        return entry
+
+    def _release_slot(self):
+        with self._lock:
+            self._open -= 1
+            self._lock.notify()
+
+    def _checkin(self, entry, broken):
+        if broken:
+            self._count('discarded')
+            self._close(entry)
+            self._release_slot()
+            return
+        with self._lock:
+            if self._closed:
+                self._open -= 1
+                self._close(entry)
+            else:
+                self._idle.append((entry[0], entry[1], time.monotonic(), entry[3]))
+            self._lock.notify()
+
+    @contextmanager
+    def checkout(self):
+        # Yields (connection, cursor). Commits when the block finishes, rolls
+        # back if it raises; connections that fail to roll back are dropped.
+        entry = self._checkout()
+        connection = entry[0]
+        broken = False
+        try:
+            yield connection, entry[1]
+            connection.commit()
+        except BaseException:
+            try:
+                connection.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self._checkin(entry, broken)
+
+    @contextmanager
+    def connection(self):
+        with self.checkout() as (connection, _):
+            yield connection
+
+    @contextmanager
+    def cursor(self):
+        # The cursor is created once per connection and reused by every
+        # checkout of that connection
+        with self.checkout() as (_, cursor):
+            yield cursor
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            for entry in self._idle:
+                self._close(entry)
+                self._open -= 1
+            self._idle = []
+            self._lock.notify_all()
+
+
+def mysql_pool(size=5, max_idle=300, health_check_interval=30, timeout=30,
+               max_statements=64, **config):
+    # config is passed to mysql.connector.connect (host, user, password, ...)
+    import mysql.connector
+
+    return ConnectionPool(lambda: mysql.connector.connect(**config), size=size,
+                          max_idle=max_idle,
+                          health_check_interval=health_check_interval,
+                          timeout=timeout, dialect='mysql', placeholder='%s',
+                          error=mysql.connector.Error,
+                          max_statements=max_statements)
+
+
+def sqlite_pool(path, size=5, **kwargs):
+    # Local stand-in for MySQL; path must be a file so that every pooled
+    # connection sees the same database
+    def connect():
+        return sqlite3.connect(path, check_same_thread=False, timeout=30)
+
+    return ConnectionPool(connect, size=size, dialect='sqlite', placeholder='?',
+                          error=sqlite3.Error, **kwargs)
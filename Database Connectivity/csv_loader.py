@@ -0,0 +1,309 @@
+"""Load a CSV of gods or goddesses into the database in parallel.
+
+Usage:
+    python csv_loader.py greek_gods.csv [--db deities.db] [--chunk-rows 10000]
+                         [--workers N] [--writers 4]
+    python csv_loader.py greek_gods.csv --mysql-host HOST --mysql-user USER
+                         --mysql-password PW --mysql-database DB [--load-data]
+
+The file has the shape of Python/use case 2/greek_gods.csv: a header of
+God (or Goddess), Domain, Symbol, Age. Rows keep that first header as their
+kind, so gods and goddesses loaded into the same table stay apart. It is read in chunks of --chunk-rows
+rows. A process pool validates and converts the chunks, and --writers pooled
+connections insert them concurrently with multi-row INSERTs. With
+--load-data, MySQL gets LOAD DATA LOCAL INFILE instead.
+
+Each chunk is committed together with a row in load_progress, so a load that
+stops part way can simply be run again. Chunks that were already committed
+are skipped, and nothing is inserted twice. Progress is kept per path, file
+size and modification time, so a different file later saved under the same
+path is loaded from the start. Rows that fail validation are counted and
+reported, not loaded.
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+
+from connection_pool import mysql_pool, sqlite_pool
+from statements import prepared
+
+TABLE_SCHEMAS = {
+    "mysql": (
+        "CREATE TABLE IF NOT EXISTS deities ("
+        "id INT AUTO_INCREMENT PRIMARY KEY,"
+        "name VARCHAR(100) NOT NULL,"
+        "domain VARCHAR(100) NOT NULL,"
+        "symbol VARCHAR(100) NOT NULL,"
+        "age INT NOT NULL,"
+        "kind VARCHAR(20)"
+        ")"
+    ),
+    "sqlite": (
+        "CREATE TABLE IF NOT EXISTS deities ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        "name VARCHAR(100) NOT NULL,"
+        "domain VARCHAR(100) NOT NULL,"
+        "symbol VARCHAR(100) NOT NULL,"
+        "age INTEGER NOT NULL,"
+        "kind VARCHAR(20)"
+        ")"
+    ),
+}
+
+# One row per committed chunk of each load, written in the chunk's own
+# transaction; source names the file (path, size and mtime) and the chunk
+# size it was split with
+PROGRESS_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS load_progress ("
+    "source VARCHAR(255) NOT NULL,"
+    "chunk INT NOT NULL,"
+    "row_count INT NOT NULL,"
+    "PRIMARY KEY (source, chunk)"
+    ")"
+)
+
+COLUMNS = ("name", "domain", "symbol", "age", "kind")
+
+# Header names accepted for the first column, and the kind they give the rows
+# (a plain "Name" column says neither)
+KIND_HEADERS = {"God": "God", "Goddess": "Goddess", "Name": None}
+
+MAX_TEXT_LENGTH = 100
+
+# Most bound parameters one statement may carry (older SQLite builds allow 999)
+MAX_PARAMS_PER_STATEMENT = {
+    "sqlite": 999,
+}
+
+
+def read_chunks(path, chunk_rows):
+    # Yield (chunk number, first line number, kind, raw rows) without holding
+    # more than one chunk of the file in memory
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        if [name.strip() for name in header[1:4]] != ["Domain", "Symbol", "Age"] \
+                or header[0].strip() not in KIND_HEADERS:
+            raise ValueError("unexpected header in %s: %r" % (path, header))
+        kind = KIND_HEADERS[header[0].strip()]
+        chunk = 0
+        line = 2
+        while True:
+            rows = list(islice(reader, chunk_rows))
+            if not rows:
+                break
+            yield chunk, line, kind, rows
+            chunk += 1
+            line += len(rows)
+
+
+def convert_row(row, kind):
+    # (name, domain, symbol, age, kind) or raise ValueError
+    if len(row) != len(COLUMNS) - 1:
+        raise ValueError("expected %d fields, got %d" % (len(COLUMNS) - 1, len(row)))
+    name, domain, symbol, age = (value.strip() for value in row)
+    for column, value in (("name", name), ("domain", domain), ("symbol", symbol)):
+        if not value:
+            raise ValueError("%s is empty" % column)
+        if len(value) > MAX_TEXT_LENGTH:
+            raise ValueError("%s is longer than %d characters" % (column, MAX_TEXT_LENGTH))
+    age = int(age)
+    if age < 0:
+        raise ValueError("age is negative")
+    return name, domain, symbol, age, kind
+
+
+def convert_chunk(chunk, line, kind, rows):
+    # Runs in a worker process: (chunk, converted rows, [(line, error)])
+    converted = []
+    errors = []
+    for offset, row in enumerate(rows):
+        try:
+            converted.append(convert_row(row, kind))
+        except ValueError as error:
+            errors.append((line + offset, str(error)))
+    return chunk, converted, errors
+
+
+def create_tables(pool):
+    try:
+        with pool.cursor() as cursor:
+            cursor.execute(TABLE_SCHEMAS[pool.dialect])
+            cursor.execute(PROGRESS_SCHEMA)
+            # deities tables created before the kind column get it added
+            cursor.execute("SELECT * FROM deities WHERE 1 = 0")
+            cursor.fetchall()
+            if "kind" not in [column[0] for column in cursor.description]:
+                cursor.execute("ALTER TABLE deities ADD COLUMN kind VARCHAR(20)")
+    except pool.Error as error:
+        print("Error creating tables:", error)
+        raise
+
+
+def committed_chunks(pool, source):
+    query = "SELECT chunk FROM load_progress WHERE source = {0}".format(pool.placeholder)
+    with prepared(pool) as statements:
+        return {row[0] for row in statements.fetchall(query, (source,))}
+
+
+def insert_query(pool, rows):
+    values = "(%s)" % ", ".join([pool.placeholder] * len(COLUMNS))
+    return "INSERT INTO deities (%s) VALUES %s" % (", ".join(COLUMNS), ", ".join([values] * rows))
+
+
+def progress_query(pool):
+    return "INSERT INTO load_progress (source, chunk, row_count) VALUES ({0}, {0}, {0})".format(
+        pool.placeholder)
+
+
+def write_chunk(pool, source, chunk, rows):
+    # Multi-row INSERTs plus the progress row, all in one transaction
+    statement_rows = MAX_PARAMS_PER_STATEMENT.get(pool.dialect, 4000) // len(COLUMNS)
+    with prepared(pool) as statements:
+        for i in range(0, len(rows), statement_rows):
+            part = rows[i:i + statement_rows]
+            statements.execute(insert_query(pool, len(part)),
+                               [value for row in part for value in row])
+        statements.execute(progress_query(pool), (source, chunk, len(rows)))
+    return len(rows)
+
+
+def escape_field(value):
+    # For LOAD DATA's default FIELDS ESCAPED BY '\\'
+    if value is None:
+        return "\\N"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def load_data_chunk(pool, source, chunk, rows):
+    # MySQL only: stream the chunk through LOAD DATA LOCAL INFILE, which the
+    # server parses far faster than the equivalent INSERT statements
+    fd, path = tempfile.mkstemp(suffix=".tsv")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            for row in rows:
+                f.write("\t".join(escape_field(value) for value in row))
+                f.write("\n")
+        with pool.checkout() as (_, cursor):
+            cursor.execute(
+                "LOAD DATA LOCAL INFILE '%s' INTO TABLE deities CHARACTER SET utf8mb4 "
+                "FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' (%s)"
+                % (path.replace("\\", "\\\\").replace("'", "\\'"), ", ".join(COLUMNS)))
+            cursor.execute(progress_query(pool), (source, chunk, len(rows)))
+    finally:
+        os.remove(path)
+    return len(rows)
+
+
+def load_source(path, chunk_rows):
+    # The load_progress key: the path alone would let a new file saved there
+    # skip chunks that were committed for the old one
+    stat = os.stat(path)
+    return "%s:%d:%d:%d" % (os.path.abspath(path)[-200:], stat.st_size,
+                            stat.st_mtime_ns, chunk_rows)
+
+
+def load_csv(pool, path, chunk_rows=10000, workers=None, writers=4, load_data=False):
+    # Returns (rows loaded, rows rejected). Chunks already recorded in
+    # load_progress for this file and chunk size are skipped.
+    create_tables(pool)
+    source = load_source(path, chunk_rows)
+    done = committed_chunks(pool, source)
+    if done:
+        print("Resuming: %d chunks of %s already loaded." % (len(done), path))
+    write = load_data_chunk if load_data else write_chunk
+
+    loaded = rejected = 0
+    max_pending = 2 * max(writers, workers or os.cpu_count() or 1)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as converters, \
+            ThreadPoolExecutor(max_workers=writers, thread_name_prefix="writer") as writer_pool:
+        conversions = deque()
+        writes = deque()
+
+        def finish_write():
+            nonlocal loaded
+            loaded += writes.popleft().result()
+
+        def finish_conversion():
+            nonlocal rejected
+            chunk, rows, errors = conversions.popleft().result()
+            for line, error in errors[:5]:
+                print("Rejected line %d: %s" % (line, error))
+            rejected += len(errors)
+            writes.append(writer_pool.submit(write, pool, source, chunk, rows))
+            # keep at most max_pending chunks waiting on the writers
+            while len(writes) >= max_pending:
+                finish_write()
+
+        try:
+            for chunk, line, kind, rows in read_chunks(path, chunk_rows):
+                if chunk in done:
+                    continue
+                conversions.append(converters.submit(convert_chunk, chunk, line, kind, rows))
+                while len(conversions) >= max_pending:
+                    finish_conversion()
+            while conversions:
+                finish_conversion()
+            while writes:
+                finish_write()
+        except pool.Error as error:
+            # Committed chunks stay recorded; running again picks up the rest
+            print("Error loading %s after %d rows:" % (path, loaded), error)
+            for future in conversions:
+                future.cancel()
+            raise
+
+    elapsed = time.perf_counter() - start
+    print("Loaded %d rows (%d rejected) in %.2f s (%.0f rows/sec)." % (
+        loaded, rejected, elapsed, loaded / elapsed if elapsed else 0.0))
+    return loaded, rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("csv")
+    parser.add_argument("--chunk-rows", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes converting rows (default: one per CPU)")
+    parser.add_argument("--writers", type=int, default=4,
+                        help="connections writing chunks at the same time")
+    parser.add_argument("--db", default="deities.db",
+                        help="SQLite file used when no MySQL server is given")
+    parser.add_argument("--mysql-host")
+    parser.add_argument("--mysql-user")
+    parser.add_argument("--mysql-password")
+    parser.add_argument("--mysql-database")
+    parser.add_argument("--load-data", action="store_true",
+                        help="use LOAD DATA LOCAL INFILE (MySQL only)")
+    args = parser.parse_args()
+
+    if args.mysql_host:
+        pool = mysql_pool(size=args.writers, host=args.mysql_host, user=args.mysql_user,
+                          password=args.mysql_password, database=args.mysql_database,
+                          allow_local_infile=args.load_data)
+    else:
+        if args.load_data:
+            parser.error("--load-data needs a MySQL server")
+        pool = sqlite_pool(args.db, size=args.writers)
+
+    try:
+        load_csv(pool, args.csv, chunk_rows=args.chunk_rows, workers=args.workers,
+                 writers=args.writers, load_data=args.load_data)
+    except pool.Error:
+        sys.exit(1)
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
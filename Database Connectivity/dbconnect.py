@@ -1,76 +1,297 @@
-import mysql.connector
+import time
+from itertools import islice
 
-def create_table(cursor):
+from connection_pool import mysql_pool
+from statements import prepared, query_stats
+
+# Table schema for each database we can talk to (SQLite is the local stand-in)
+TABLE_SCHEMAS = {
+    "mysql": (
+        "CREATE TABLE IF NOT EXISTS users ("
+        "id INT AUTO_INCREMENT PRIMARY KEY,"
+        "username VARCHAR(50) NOT NULL,"
+        "email VARCHAR(100) NOT NULL"
+        ")"
+    ),
+    "sqlite": (
+        "CREATE TABLE IF NOT EXISTS users ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        "username VARCHAR(50) NOT NULL,"
+        "email VARCHAR(100) NOT NULL"
+        ")"
+    ),
+}
+
+# Columns a projection may ask for
+USER_COLUMNS = ("id", "username", "email")
+
+# Cursor options that stream rows from the server instead of buffering the
+# whole result client-side (SQLite cursors already step row by row)
+STREAMING_CURSOR_OPTIONS = {
+    "mysql": {"buffered": False},
+}
+
+# Most rows one multi-row INSERT may carry (older SQLite builds allow only
+# 999 bound parameters per statement)
+MAX_ROWS_PER_STATEMENT = {
+    "sqlite": 499,
+}
+
+# Secondary indexes on users: (name, columns, unique). Applied by
+# create_indexes, which skips any that already exist, so new entries can
+# simply be appended here.
+USER_INDEXES = (
+    ("idx_users_username", ("username",), False),
+    ("idx_users_email", ("email",), False),
+)
+
+# Where each dialect lists the indexes of a table
+INDEX_EXISTS_QUERIES = {
+    "mysql": (
+        "SELECT 1 FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = 'users' AND index_name = %s "
+        "LIMIT 1"
+    ),
+    "sqlite": "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+}
+
+# The lookups the application runs all the time, with a sample parameter;
+# explain_queries checks that none of them scans the whole table or a whole
+# index
+COMMON_QUERIES = {
+    "user by id": ("SELECT id, username, email FROM users WHERE id = {0}", 1),
+    "user by username": ("SELECT id, username, email FROM users WHERE username = {0}", "john_doe"),
+    "user by email": ("SELECT id, username, email FROM users WHERE email = {0}", "john@example.com"),
+    "users after id": ("SELECT id, username, email FROM users WHERE id > {0} ORDER BY id LIMIT 1000", 0),
+}
+
+def create_table(pool):
     try:
         # Define the table schema
-        table_schema = (
-            "CREATE TABLE IF NOT EXISTS users ("
-            "id INT AUTO_INCREMENT PRIMARY KEY,"
-            "username VARCHAR(50) NOT NULL,"
-            "email VARCHAR(100) NOT NULL"
-            ")"
-        )
-        
+        table_schema = TABLE_SCHEMAS[pool.dialect]
+
         # Create the table
-        cursor.execute(table_schema)
+        with pool.cursor() as cursor:
+            cursor.execute(table_schema)
         print("Table 'users' created successfully.")
-    except mysql.connector.Error as error:
+    except pool.Error as error:
         print("Error creating table:", error)
 
-def insert_data(cursor, username, email):
+def index_exists(pool, name):
+    with prepared(pool) as statements:
+        return statements.fetchone(INDEX_EXISTS_QUERIES[pool.dialect], (name,)) is not None
+
+def create_indexes(pool, indexes=USER_INDEXES):
+    # MySQL has no CREATE INDEX IF NOT EXISTS, so look each index up first.
+    # Safe to run on every start; returns the names of the indexes it created.
+    created = []
+    try:
+        for name, columns, unique in indexes:
+            if index_exists(pool, name):
+                continue
+            with pool.cursor() as cursor:
+                cursor.execute("CREATE %sINDEX %s ON users (%s)" % (
+                    "UNIQUE " if unique else "", name, ", ".join(columns)))
+            created.append(name)
+            print("Index '%s' created successfully." % name)
+    except pool.Error as error:
+        print("Error creating indexes:", error)
+    return created
+
+def migrate(pool):
+    # Bring the users table and its indexes up to date
+    create_table(pool)
+    return create_indexes(pool)
+
+def query_plan(pool, query, params):
+    # (plan rows, full scan?) for one query. A scan of a whole index counts
+    # as a full scan too: it reads every entry, only from a narrower table.
+    with pool.cursor() as cursor:
+        if pool.dialect == "sqlite":
+            # rows are (id, parent, notused, detail), e.g. "SCAN users",
+            # "SCAN users USING COVERING INDEX idx_users_email" or
+            # "SEARCH users USING INDEX idx_users_email (email=?)"
+            cursor.execute("EXPLAIN QUERY PLAN " + query, params)
+            plan = cursor.fetchall()
+            details = [row[3] for row in plan]
+            full_scan = any(detail.startswith("SCAN ") and detail != "SCAN CONSTANT ROW"
+                            for detail in details)
+            return details, full_scan
+        cursor.execute("EXPLAIN " + query, params)
+        names = [column[0] for column in cursor.description]
+        plan = [dict(zip(names, row)) for row in cursor.fetchall()]
+        # access type ALL is a full table scan, index a full index scan
+        full_scan = any(row.get("type") in ("ALL", "index") for row in plan)
+        return plan, full_scan
+
+def explain_queries(pool, queries=COMMON_QUERIES):
+    # Print the plan of each common query and return the names of those
+    # that scan the whole table
+    full_scans = []
+    try:
+        for name, (query, param) in queries.items():
+            plan, full_scan = query_plan(pool, query.format(pool.placeholder), (param,))
+            if full_scan:
+                full_scans.append(name)
+            print("%-4s %-18s %s" % ("SCAN" if full_scan else "ok", name, plan))
+    except pool.Error as error:
+        print("Error explaining queries:", error)
+    return full_scans
+
+def insert_data(pool, username, email, cache=None):
     try:
         # Insert data into the table
-        insert_query = "INSERT INTO users (username, email) VALUES (%s, %s)"
+        insert_query = "INSERT INTO users (username, email) VALUES ({0}, {0})".format(pool.placeholder)
         user_data = (username, email)
-        cursor.execute(insert_query, user_data)
+        with prepared(pool) as statements:
+            user_id = statements.execute(insert_query, user_data).lastrowid
+        # Drop anything cached under the new row's keys (e.g. a "no such user")
+        if cache is not None:
+            cache.invalidate(user_id=user_id, username=username, email=email)
         print("Data inserted successfully.")
-    except mysql.connector.Error as error:
+    except pool.Error as error:
         print("Error inserting data:", error)
 
-def fetch_data(cursor):
+def get_user(pool, column, value):
+    # One user by id, username or email, or None
+    if column not in USER_COLUMNS:
+        raise ValueError("unknown users column: %r" % column)
+    query = "SELECT id, username, email FROM users WHERE {1} = {0} LIMIT 1".format(
+        pool.placeholder, column)
+    with prepared(pool) as statements:
+        return statements.fetchone(query, (value,))
+
+def multi_row_insert_query(pool, rows):
+    values = "({0}, {0})".format(pool.placeholder)
+    return "INSERT INTO users (username, email) VALUES " + ", ".join([values] * rows)
+
+def bulk_insert(pool, users, batch_size=1000, multi_row=True, cache=None):
+    # Insert an iterable (or generator) of (username, email) pairs, batch_size
+    # rows at a time with one commit per batch. Only one batch is held in
+    # memory, whatever the size of the input.
+    statement_rows = min(batch_size, MAX_ROWS_PER_STATEMENT.get(pool.dialect, batch_size))
+    single_query = "INSERT INTO users (username, email) VALUES ({0}, {0})".format(pool.placeholder)
+    queries = {}
+
+    users = iter(users)
+    total = 0
+    start = time.perf_counter()
+    try:
+        while True:
+            batch = list(islice(users, batch_size))
+            if not batch:
+                break
+
+            with prepared(pool) as statements:
+                if not multi_row:
+                    statements.executemany(single_query, batch)
+                else:
+                    for i in range(0, len(batch), statement_rows):
+                        rows = batch[i:i + statement_rows]
+                        if len(rows) not in queries:
+                            queries[len(rows)] = multi_row_insert_query(pool, len(rows))
+                        statements.execute(queries[len(rows)],
+                                           [value for row in rows for value in row])
+            if cache is not None:
+                cache.invalidate_batch(batch)
+            total += len(batch)
+    except pool.Error as error:
+        print("Error inserting data after %d rows:" % total, error)
+
+    elapsed = time.perf_counter() - start
+    print("Inserted %d rows in %.2f s (%.0f rows/sec)." % (
+        total, elapsed, total / elapsed if elapsed else 0.0))
+    return total
+
+def select_columns(columns):
+    columns = tuple(columns or USER_COLUMNS)
+    for column in columns:
+        if column not in USER_COLUMNS:
+            raise ValueError("unknown users column: %r" % column)
+    return columns
+
+def iter_users(pool, columns=None, batch_size=1000):
+    # Stream rows of one SELECT with fetchmany, holding one connection for the
+    # whole scan but never more than batch_size rows in client memory
+    select_query = "SELECT %s FROM users" % ", ".join(select_columns(columns))
+    with pool.connection() as connection:
+        cursor = connection.cursor(**STREAMING_CURSOR_OPTIONS.get(pool.dialect, {}))
+        finished = False
+        try:
+            cursor.execute(select_query)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    finished = True
+                    break
+                yield from rows
+        finally:
+            if not finished and pool.dialect in STREAMING_CURSOR_OPTIONS:
+                # The caller stopped early. An unbuffered MySQL cursor can't be
+                # closed with rows still unread ("Unread result found"), which
+                # would also fail the rollback and lose the connection.
+                try:
+                    while cursor.fetchmany(batch_size):
+                        pass
+                except pool.Error:
+                    pass
+            cursor.close()
+
+def scan_users(pool, columns=None, batch_size=1000, after_id=0):
+    # Keyset pagination on id: every page is its own short query, so a scan
+    # can be resumed from the last id it saw (pass it as after_id)
+    columns = select_columns(columns)
+    # id is needed to find the next page even if the caller didn't ask for it
+    with_id = columns if "id" in columns else ("id",) + columns
+    id_index = with_id.index("id")
+    page_query = "SELECT {1} FROM users WHERE id > {0} ORDER BY id LIMIT {0}".format(
+        pool.placeholder, ", ".join(with_id))
+
+    while True:
+        with prepared(pool) as statements:
+            rows = statements.fetchall(page_query, (after_id, batch_size))
+        if not rows:
+            break
+        after_id = rows[-1][id_index]
+        for row in rows:
+            yield row if with_id is columns else row[1:]
+        if len(rows) < batch_size:
+            break
+
+def fetch_data(pool):
     try:
-        # Fetch data from the table
-        select_query = "SELECT * FROM users"
-        cursor.execute(select_query)
-        users = cursor.fetchall()
-        
+        # Stream the table instead of loading it all with fetchall()
         print("\nUsers:")
-        for user in users:
+        for user in iter_users(pool):
             print(f"ID: {user[0]}, Username: {user[1]}, Email: {user[2]}")
-    except mysql.connector.Error as error:
+    except pool.Error as error:
         print("Error fetching data:", error)
 
-try:
-    # Connect to the database
-    connection = mysql.connector.connect(
+if __name__ == "__main__":
+    # Connections are opened lazily by the pool and reused between calls
+    pool = mysql_pool(
+        size=5,
         host="your_host",
         user="your_username",
         password="your_password",
         database="your_database"
     )
 
-    if connection.is_connected():
-        print("Connected to MySQL database")
-    
-    # Create a cursor object to execute queries
-    cursor = connection.cursor()
-
-    # Create table
-    create_table(cursor)
+    try:
+        # Create table and indexes
+        migrate(pool)
 
-    # Insert data
-    insert_data(cursor, "john_doe", "john@example.com")
-    insert_data(cursor, "jane_doe", "jane@example.com")
+        # Insert data
+        insert_data(pool, "john_doe", "john@example.com")
+        insert_data(pool, "jane_doe", "jane@example.com")
 
-    # Fetch data
-    fetch_data(cursor)
+        # Fetch data
+        fetch_data(pool)
 
-except mysql.connector.Error as error:
-    print("Error connecting to MySQL database:", error)
+        # Per-statement latency, rows and errors so far
+        print(query_stats.to_json())
 
-finally:
-    if 'connection' in locals() and connection.is_connected():
-        # Close cursor and connection
-        cursor.close()
-        connection.close()
-        print("MySQL connection closed")
+    finally:
+        # Close every pooled connection
+        pool.close()
+        print("MySQL connection pool closed")
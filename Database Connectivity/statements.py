@@ -0,0 +1,183 @@
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds of the latency histogram buckets, in seconds; anything slower
+# than the last one lands in the overflow bucket
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# A parenthesised group repeated back to back, like the VALUES rows of a
+# multi-row INSERT
+REPEATED_GROUP_RE = re.compile(r'(\([^()]*\))(?:, \1)+')
+
+
+def statement_key(sql):
+    # Shorten "VALUES (?, ?), (?, ?), ..." to "VALUES (?, ?) x500" so every
+    # batch size still gets its own entry without a huge key
+    def shorten(match):
+        group = match.group(1)
+        return "%s x%d" % (group, (len(match.group(0)) + 2) // (len(group) + 2))
+    return REPEATED_GROUP_RE.sub(shorten, sql)
+
+
+def bucket_label(bound):
+    return "<=%gms" % (bound * 1000) if bound is not None else ">%gms" % (LATENCY_BUCKETS[-1] * 1000)
+
+
+class StatementStats:
+    # Calls, errors, rows and latencies of one SQL text
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def record(self, elapsed, rows, error):
+        self.calls += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        if error:
+            self.errors += 1
+        else:
+            self.rows += rows
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the given fraction of calls (the
+        # slowest call if it is in the overflow bucket)
+        target = fraction * self.calls
+        seen = 0
+        for i, count in enumerate(self.histogram[:-1]):
+            seen += count
+            if count and seen >= target:
+                return min(LATENCY_BUCKETS[i], self.max_time)
+        return self.max_time
+
+    def to_dict(self):
+        bounds = LATENCY_BUCKETS + (None,)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "total_ms": round(self.total_time * 1000, 3),
+            "mean_ms": round(self.total_time / self.calls * 1000, 3) if self.calls else 0.0,
+            "p50_ms": round(self.percentile(0.5) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "max_ms": round(self.max_time * 1000, 3),
+            "histogram": {bucket_label(bound): count
+                          for bound, count in zip(bounds, self.histogram) if count},
+        }
+
+
+class QueryStats:
+    # Thread-safe registry of StatementStats keyed by (shortened) SQL text
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._keys = {}
+
+    def record(self, sql, elapsed, rows=0, error=False):
+        with self._lock:
+            key = self._keys.get(sql)
+            if key is None:
+                key = self._keys[sql] = statement_key(sql)
+            stats = self._statements.get(key)
+            if stats is None:
+                stats = self._statements[key] = StatementStats()
+            stats.record(elapsed, rows, error)
+
+    def snapshot(self):
+        # {sql: stats dict}, the statements with the most total time first
+        with self._lock:
+            ordered = sorted(self._statements.items(),
+                             key=lambda item: item[1].total_time, reverse=True)
+            return {sql: stats.to_dict() for sql, stats in ordered}
+
+    def to_json(self, indent=2):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+
+
+# Shared by everything in dbconnect unless a caller passes its own
+query_stats = QueryStats()
+
+
+class Statements:
+    # Runs SQL on one checked-out connection through the pool's prepared
+    # cursors, timing every call into a QueryStats
+
+    def __init__(self, pool, connection, stats):
+        self.pool = pool
+        self.connection = connection
+        self.stats = stats
+
+    def _run(self, sql, call, cursor=None):
+        if cursor is None:
+            cursor = self.pool.prepared_cursor(self.connection, sql)
+        start = time.perf_counter()
+        try:
+            result, rows = call(cursor)
+        except Exception:
+            self.stats.record(sql, time.perf_counter() - start, error=True)
+            raise
+        self.stats.record(sql, time.perf_counter() - start, rows)
+        return result
+
+    def execute(self, sql, params=()):
+        # Returns the cursor, e.g. for lastrowid; rows counted are rowcount
+        def call(cursor):
+            cursor.execute(sql, params)
+            return cursor, max(cursor.rowcount, 0)
+        return self._run(sql, call)
+
+    def executemany(self, sql, seq_of_params):
+        # On a plain cursor, not a prepared one: mysql-connector's prepared
+        # cursor runs executemany as one execute per row, while the plain one
+        # folds an INSERT's rows into a single multi-row statement
+        def call(cursor):
+            cursor.executemany(sql, seq_of_params)
+            return None, max(cursor.rowcount, 0)
+        cursor = self.connection.cursor()
+        try:
+            return self._run(sql, call, cursor)
+        finally:
+            cursor.close()
+
+    def fetchone(self, sql, params=()):
+        def call(cursor):
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+            # drain anything left so the cursor can be reused
+            cursor.fetchall()
+            return row, 0 if row is None else 1
+        return self._run(sql, call)
+
+    def fetchall(self, sql, params=()):
+        def call(cursor):
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+            return rows, len(rows)
+        return self._run(sql, call)
+
+
+@contextmanager
+def prepared(pool, stats=None):
+    # Check out a connection and yield a Statements for it; commits when the
+    # block finishes and rolls back if it raises, like pool.checkout()
+    with pool.connection() as connection:
+        yield Statements(pool, connection, stats if stats is not None else query_stats)
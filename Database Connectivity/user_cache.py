@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import OrderedDict
+
+from dbconnect import get_user
+
+# cached in place of a row when the user doesn't exist
+MISSING = object()
+
+
+class UserCache:
+    # Read-through cache for single-user lookups. Entries are kept in LRU
+    # order, expire after `ttl` seconds and the least recently used ones are
+    # evicted once there are more than `max_size`. A row is cached under the
+    # key it was looked up by and under its id. username and email are not
+    # unique, so a row found by id is not cached for them: a lookup by
+    # username or email must return the row get_user picks among duplicates.
+    # Pass the cache to insert_data/bulk_insert so their writes invalidate
+    # the affected keys.
+
+    def __init__(self, pool, max_size=10000, ttl=300):
+        self.pool = pool
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # bumped by every invalidation; a lookup only stores what it read if
+        # no invalidation happened while it was at the database
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get_by_id(self, user_id):
+        return self._get("id", user_id)
+
+    def get_by_username(self, username):
+        return self._get("username", username)
+
+    def get_by_email(self, email):
+        return self._get("email", email)
+
+    def _get(self, column, value):
+        key = (column, value)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                row, expires = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return None if row is MISSING else row
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            generation = self._generation
+
+        # Go to the database outside the lock so other lookups aren't held up
+        row = get_user(self.pool, column, value)
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            if generation != self._generation:
+                # a write may have landed after our read; don't cache it
+                return row
+            if row is None:
+                self._put(key, MISSING, expires)
+            else:
+                self._put(key, row, expires)
+                self._put(("id", row[0]), row, expires)
+        return row
+
+    def _put(self, key, row, expires):
+        self._entries[key] = (row, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id=None, username=None, email=None):
+        with self._lock:
+            self._generation += 1
+            for key in (("id", user_id), ("username", username), ("email", email)):
+                if key[1] is not None and self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def invalidate_batch(self, users):
+        # After a bulk insert of (username, email) pairs. The new ids aren't
+        # known, so cached "no such id" answers are dropped as well.
+        with self._lock:
+            self._generation += 1
+            for username, email in users:
+                for key in (("username", username), ("email", email)):
+                    if self._entries.pop(key, None) is not None:
+                        self.invalidations += 1
+            for key in [key for key, (row, _) in self._entries.items()
+                        if key[0] == "id" and row is MISSING]:
+                del self._entries[key]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
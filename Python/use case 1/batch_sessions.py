@@ -0,0 +1,227 @@
+"""Validate and summarize a whole directory tree of training session files.
+
+Usage:
+    python batch_sessions.py path [path ...] [--workers N] [--chunk-files 256]
+                             [--top 10] [--progress-every 2] [--json]
+
+Directories are walked recursively for *.json files (hidden ones are
+skipped). The file list is cut into chunks of --chunk-files paths, and each
+chunk is one task in a multiprocessing pool. Workers decode their files
+into session_models records and validate them: the structure, a boolean
+"completed", and an email address for every participant. They return one
+set of partial totals per chunk rather than a result per file. Totals
+cover:
+- sessions read and files rejected,
+- completed against not completed,
+- participants per instructor,
+- for each email, the number of sessions it appears in.
+The parent adds the chunks up as they finish. An email counted in more
+than one session is a duplicate across sessions; repeats within a single
+session are counted once.
+
+While it runs, a progress line goes to stderr every --progress-every
+seconds: files done, files/s and MB/s. The summary goes to stdout, as text
+or, with --json, as one JSON object.
+"""
+import argparse
+import heapq
+import json
+import os
+import sys
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+from session_models import decode_session
+
+DEFAULT_CHUNK_FILES = 256
+
+# rejected files listed in the summary (the first by path); the rest are
+# only counted
+MAX_ERRORS = 20
+
+
+def discover(paths):
+    # .json files as given, directories walked recursively (hidden files skipped)
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+                files.extend(os.path.join(root, name) for name in sorted(names)
+                             if name.endswith('.json') and not name.startswith('.'))
+        else:
+            files.append(path)
+    return files
+
+
+def chunks(files, size):
+    return [files[start:start + size] for start in range(0, len(files), size)]
+
+
+def new_totals():
+    return {
+        'files': 0,
+        'bytes': 0,
+        'sessions': 0,
+        'invalid': 0,
+        'completed': 0,
+        'not_completed': 0,
+        'participants': 0,
+        'instructors': Counter(),
+        # the parent counts sessions per email; a chunk only lists them, once
+        # per session, since Counter.update counts a list in C but adds up
+        # another Counter in Python
+        'emails': [],
+        'errors': [],
+    }
+
+
+def add_totals(totals, part):
+    for key in ('files', 'bytes', 'sessions', 'invalid', 'completed', 'not_completed',
+                'participants'):
+        totals[key] += part[key]
+    totals['instructors'].update(part['instructors'])
+    totals['emails'].update(part['emails'])
+    # chunks finish in any order; keeping the first paths makes the list
+    # the same from run to run
+    totals['errors'] = heapq.nsmallest(MAX_ERRORS, totals['errors'] + part['errors'])
+
+
+def validate(session):
+    # decode_session checks the structure; this checks the values
+    if not isinstance(session.completed, bool):
+        raise ValueError("completed must be true or false, not %r" % (session.completed,))
+    if not isinstance(session.instructor.name, str):
+        raise ValueError("instructor name must be a string")
+    for participant in session.participants:
+        if not isinstance(participant.email, str) or '@' not in participant.email:
+            raise ValueError("invalid email %r for %r" % (participant.email, participant.name))
+
+
+def process_chunk(paths):
+    # Partial totals for one chunk of files
+    totals = new_totals()
+    for path in paths:
+        totals['files'] += 1
+        try:
+            with open(path, 'rb') as f:
+                text = f.read()
+            totals['bytes'] += len(text)
+            session = decode_session(text)
+            validate(session)
+        # json raises RecursionError on very deeply nested input
+        except (OSError, ValueError, RecursionError) as error:
+            totals['invalid'] += 1
+            if len(totals['errors']) < MAX_ERRORS:
+                totals['errors'].append((path, str(error)))
+            continue
+        totals['sessions'] += 1
+        totals['completed' if session.completed else 'not_completed'] += 1
+        totals['participants'] += len(session.participants)
+        totals['instructors'][session.instructor.name] += len(session.participants)
+        # an email repeated inside one session is not a duplicate across sessions
+        totals['emails'].extend({participant.email for participant in session.participants})
+    return totals
+
+
+def run_batch(paths, workers=None, chunk_files=DEFAULT_CHUNK_FILES, progress_every=2.0,
+              progress=sys.stderr):
+    # Totals for every file under paths, plus the run's timings
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    files = discover(paths)
+    discovered = time.perf_counter()
+
+    totals = new_totals()
+    totals['emails'] = Counter()
+    last_report = discovered
+    with Pool(workers) as pool:
+        for part in pool.imap_unordered(process_chunk, chunks(files, chunk_files)):
+            add_totals(totals, part)
+            now = time.perf_counter()
+            if progress and progress_every and now - last_report >= progress_every:
+                last_report = now
+                elapsed = now - discovered
+                print("%d/%d files (%.0f%%), %.0f files/s, %.1f MB/s" % (
+                    totals['files'], len(files), 100.0 * totals['files'] / len(files),
+                    totals['files'] / elapsed, totals['bytes'] / elapsed / 1e6),
+                    file=progress)
+    done = time.perf_counter()
+
+    totals['discover_seconds'] = discovered - start
+    totals['process_seconds'] = done - discovered
+    return totals
+
+
+def summary(totals, top=10):
+    duplicates = [(email, count) for email, count in totals['emails'].items() if count > 1]
+    duplicates.sort(key=lambda item: (-item[1], item[0]))
+    seconds = totals['process_seconds']
+    return {
+        'files': totals['files'],
+        'sessions': totals['sessions'],
+        'invalid': totals['invalid'],
+        'completed': totals['completed'],
+        'not_completed': totals['not_completed'],
+        'participants': totals['participants'],
+        'instructors': len(totals['instructors']),
+        'participants_per_instructor': sorted(totals['instructors'].items(),
+                                              key=lambda item: (-item[1], item[0]))[:top],
+        'distinct_emails': len(totals['emails']),
+        'duplicate_emails': len(duplicates),
+        'top_duplicate_emails': duplicates[:top],
+        'errors': totals['errors'],
+        'discover_seconds': round(totals['discover_seconds'], 3),
+        'process_seconds': round(seconds, 3),
+        'files_per_second': round(totals['files'] / seconds, 1) if seconds else None,
+        'mb_per_second': round(totals['bytes'] / seconds / 1e6, 2) if seconds else None,
+    }
+
+
+def print_summary(result):
+    print("Files:", result['files'])
+    print("Sessions:", result['sessions'])
+    print("Invalid files:", result['invalid'])
+    for path, error in result['errors']:
+        print("  %s: %s" % (path, error))
+    print("Completed:", result['completed'])
+    print("Not completed:", result['not_completed'])
+    print("Participants:", result['participants'])
+    print("Participants per instructor (%d instructors):" % result['instructors'])
+    for name, count in result['participants_per_instructor']:
+        print("  %s: %d" % (name, count))
+    print("Distinct emails:", result['distinct_emails'])
+    print("Emails in more than one session:", result['duplicate_emails'])
+    for email, count in result['top_duplicate_emails']:
+        print("  %s: %d sessions" % (email, count))
+    print("Discovery: %.2f s, processing: %.2f s (%s files/s, %s MB/s)" % (
+        result['discover_seconds'], result['process_seconds'],
+        result['files_per_second'], result['mb_per_second']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('paths', nargs='+', help='session files or directories')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (default: all cores)')
+    parser.add_argument('--chunk-files', type=int, default=DEFAULT_CHUNK_FILES,
+                        help='files per pool task (default: %(default)s)')
+    parser.add_argument('--top', type=int, default=10,
+                        help='instructors and duplicate emails to list (default: %(default)s)')
+    parser.add_argument('--progress-every', type=float, default=2.0,
+                        help='seconds between progress lines, 0 for none '
+                             '(default: %(default)s)')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args()
+
+    totals = run_batch(args.paths, args.workers, args.chunk_files, args.progress_every)
+    result = summary(totals, args.top)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_summary(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Scaling of batch_sessions over worker counts on a synthetic session tree.
+
+Usage:
+    python bench_batch_sessions.py [--files 20000] [--participants 50]
+                                   [--workers 1,2,4] [--chunk-files 256] [--seed 0]
+                                   [--dir DIR]
+
+Writes --files session files of up to --participants participants each,
+spread over 100 subdirectories. Emails are drawn from a pool small enough
+that some repeat across sessions, and one file in a thousand is invalid.
+Without --dir the tree goes to a temporary directory and is removed
+afterwards. Each worker count then processes the whole tree. The table
+gives the processing time, the throughput and the speedup over the first
+count. The summaries of all runs are checked to be equal.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+
+from batch_sessions import run_batch, summary
+
+INSTRUCTORS = ['XYZ', 'Ada', 'Grace', 'Linus', 'Guido', 'Barbara', 'Ken', 'Dennis']
+
+
+def write_sessions(directory, files, participants, seed=0):
+    rng = random.Random(seed)
+    email_pool = files * participants // 2
+    for i in range(files):
+        subdir = os.path.join(directory, "%02d" % (i % 100))
+        os.makedirs(subdir, exist_ok=True)
+        path = os.path.join(subdir, "session-%07d.json" % i)
+        if i % 1000 == 999:
+            with open(path, 'w') as f:
+                f.write('{"name": "broken", "participants": [')
+            continue
+        session = {
+            "name": "Training %d" % i,
+            "date": "April 19, 2024",
+            "completed": rng.random() < 0.7,
+            "instructor": {"name": rng.choice(INSTRUCTORS), "website": "http://pqr.com/"},
+            "participants": [
+                {"name": "Participant %d" % n, "email": "email%d@example.com" % n}
+                for n in (rng.randrange(email_pool)
+                          for _ in range(rng.randint(1, participants)))],
+        }
+        with open(path, 'w') as f:
+            json.dump(session, f)
+
+
+def comparable(result):
+    # the summary without its timings
+    return {key: value for key, value in result.items()
+            if not key.endswith('seconds') and key not in ('files_per_second', 'mb_per_second')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--participants", type=int, default=50)
+    parser.add_argument("--workers", default="1,2,4",
+                        help="comma-separated worker counts (default: %(default)s)")
+    parser.add_argument("--chunk-files", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", help="where to write the session tree (kept)")
+    args = parser.parse_args()
+    worker_counts = [int(w) for w in args.workers.split(",")]
+
+    directory = args.dir or tempfile.mkdtemp(prefix='sessions-')
+    try:
+        write_sessions(directory, args.files, args.participants, args.seed)
+        print("%d session files, %d CPUs" % (args.files, os.cpu_count()))
+        print("%8s %10s %10s %8s %8s" % ("workers", "seconds", "files/s", "MB/s", "speedup"))
+        expected = None
+        base = None
+        for workers in worker_counts:
+            result = summary(run_batch([directory], workers, args.chunk_files,
+                                       progress_every=0))
+            base = base or result['process_seconds']
+            print("%8d %10.2f %10.0f %8.2f %7.2fx" % (
+                workers, result['process_seconds'], result['files_per_second'],
+                result['mb_per_second'], base / result['process_seconds']))
+            if expected is None:
+                expected = comparable(result)
+            elif comparable(result) != expected:
+                raise SystemExit("%d workers gave a different summary" % workers)
+        print("sessions %d, invalid %d, duplicate emails %d" % (
+            expected['sessions'], expected['invalid'], expected['duplicate_emails']))
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
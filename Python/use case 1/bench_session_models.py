@@ -0,0 +1,96 @@
+"""Plain dicts against session_models' records for a large training session.
+
+Usage:
+    python bench_session_models.py [--participants 1000000]
+
+Builds a session document with --participants entries, then decodes it
+three ways: json.loads (nested dicts), decode_session (slotted records)
+and decode_session(columnar=True). For each one it prints the decode
+time, the memory the result holds per participant (measured with
+tracemalloc), and the time of one pass reading every participant's email.
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from session_models import decode_session
+
+
+def session_json(participants):
+    return json.dumps({
+        "name": "Python Training",
+        "date": "April 19, 2024",
+        "completed": True,
+        "instructor": {"name": "XYZ", "website": "http://pqr.com/"},
+        "participants": [{"name": "Participant %d" % i, "email": "email%d@example.com" % i}
+                         for i in range(participants)],
+    })
+
+
+def held_bytes(decode, text):
+    # Memory still allocated once decode(text) has returned
+    gc.collect()
+    tracemalloc.start()
+    result = decode(text)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return held
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def dict_emails(session):
+    total = 0
+    for participant in session["participants"]:
+        total += len(participant["email"])
+    return total
+
+
+def record_emails(session):
+    total = 0
+    for participant in session.participants:
+        total += len(participant.email)
+    return total
+
+
+def column_emails(session):
+    total = 0
+    for email in session.participants.emails:
+        total += len(email)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--participants", type=int, default=1000000)
+    args = parser.parse_args()
+
+    text = session_json(args.participants)
+    runs = (('dicts', json.loads, dict_emails),
+            ('records', decode_session, record_emails),
+            ('columnar', lambda t: decode_session(t, columnar=True), column_emails))
+
+    print("%d participants, %.1f MB of JSON" % (args.participants, len(text) / 1e6))
+    print("%-10s %10s %14s %12s" % ("", "decode", "bytes/entry", "emails"))
+    totals = set()
+    for name, decode, emails in runs:
+        session, decode_seconds = timed(decode, text)
+        total, access_seconds = timed(emails, session)
+        totals.add(total)
+        del session
+        held = held_bytes(decode, text)
+        print("%-10s %8.2f s %14.1f %10.3f s" % (
+            name, decode_seconds, held / args.participants, access_seconds))
+    if len(totals) != 1:
+        raise SystemExit("the three forms read different emails")
+
+
+if __name__ == "__main__":
+    main()
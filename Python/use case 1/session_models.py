@@ -0,0 +1,203 @@
+"""Typed records for training sessions, and a decoder that builds them.
+
+    session = decode_session(training_session_json)
+    session.instructor.name
+    for participant in session.participants:
+        participant.email
+
+TrainingSession, Instructor and Participant are slotted dataclasses. They
+have no per-instance __dict__, so a participant costs its two strings plus
+a 48-byte object, instead of a dict. Attribute access is a slot lookup
+rather than a string hash.
+
+decode_session gives json.loads an object_hook. Objects with exactly the
+keys of a participant or an instructor become records as soon as they are
+parsed, so no dict is kept for them. Anything else (extra keys, say) is
+converted by the top-level hook. Missing keys, and a participant name or
+email that is not a string, raise ValueError.
+
+With columnar=True, the participants are held in a ParticipantColumns
+instead: all names in one UTF-8 buffer and all emails in another, each with
+an array of offsets. That is about 8 bytes per string plus its UTF-8
+bytes, with no Python object per participant. Records are only built when
+an entry is read. load_session builds either form from a path or stream,
+one participant at a time through session_stream.
+"""
+import gc
+import json
+from array import array
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from session_stream import open_session
+
+PARTICIPANT_KEYS = frozenset(('name', 'email'))
+INSTRUCTOR_KEYS = frozenset(('name', 'website'))
+
+
+@dataclass(slots=True)
+class Instructor:
+    name: str
+    website: str
+
+    @classmethod
+    def from_dict(cls, data):
+        try:
+            return cls(data['name'], data['website'])
+        except (KeyError, TypeError) as error:
+            raise ValueError("invalid instructor %r: %s" % (data, error))
+
+
+@dataclass(slots=True)
+class Participant:
+    name: str
+    email: str
+
+    @classmethod
+    def from_dict(cls, data):
+        try:
+            return cls.checked(data['name'], data['email'])
+        except (KeyError, TypeError) as error:
+            raise ValueError("invalid participant %r: %s" % (data, error))
+
+    @classmethod
+    def checked(cls, name, email):
+        # Columnar participant sets encode both as UTF-8, and callers only
+        # expect ValueError from a bad document
+        if type(name) is not str or type(email) is not str:
+            raise ValueError("participant name and email must be strings, not %r and %r"
+                             % (name, email))
+        return cls(name, email)
+
+
+class StringColumn:
+    # Strings stored back to back as UTF-8, with the end offset of each
+
+    def __init__(self):
+        self.data = bytearray()
+        self.ends = array('q')
+
+    def append(self, value):
+        self.data += value.encode('utf-8')
+        self.ends.append(len(self.data))
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.ends)
+        end = self.ends[index]
+        start = self.ends[index - 1] if index else 0
+        return self.data[start:end].decode('utf-8')
+
+    def __iter__(self):
+        start = 0
+        data = self.data
+        for end in self.ends:
+            yield data[start:end].decode('utf-8')
+            start = end
+
+    def nbytes(self):
+        return len(self.data) + self.ends.itemsize * len(self.ends)
+
+
+class ParticipantColumns:
+    # Participants as a name column and an email column
+
+    def __init__(self, participants=()):
+        self.names = StringColumn()
+        self.emails = StringColumn()
+        self.extend(participants)
+
+    def append(self, participant):
+        self.names.append(participant.name)
+        self.emails.append(participant.email)
+
+    def extend(self, participants):
+        for participant in participants:
+            self.append(participant)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        return Participant(self.names[index], self.emails[index])
+
+    def __iter__(self):
+        for name, email in zip(self.names, self.emails):
+            yield Participant(name, email)
+
+    def nbytes(self):
+        return self.names.nbytes() + self.emails.nbytes()
+
+
+@dataclass(slots=True)
+class TrainingSession:
+    name: str
+    date: str
+    completed: bool
+    instructor: Instructor
+    # a list of Participant, or a ParticipantColumns
+    participants: list
+
+
+def _participant(value):
+    return value if isinstance(value, Participant) else Participant.from_dict(value)
+
+
+def _build_session(data, participants):
+    instructor = data.get('instructor')
+    if not isinstance(instructor, Instructor):
+        instructor = Instructor.from_dict(instructor)
+    try:
+        return TrainingSession(data['name'], data['date'], data['completed'],
+                               instructor, participants)
+    except KeyError as error:
+        raise ValueError("training session without %s" % error)
+
+
+def _object_hook(data):
+    keys = data.keys()
+    if keys == PARTICIPANT_KEYS:
+        return Participant.checked(data['name'], data['email'])
+    if keys == INSTRUCTOR_KEYS:
+        return Instructor(data['name'], data['website'])
+    return data
+
+
+@contextmanager
+def _gc_paused():
+    # Records, unlike dicts of strings, are tracked by the cyclic GC, so
+    # creating millions of them sets off collections that can find nothing:
+    # the records only point at strings
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def decode_session(text, columnar=False):
+    with _gc_paused():
+        data = json.loads(text, object_hook=_object_hook)
+        if not isinstance(data, dict):
+            raise ValueError("a training session must be a JSON object")
+        participants = data.get('participants', [])
+        if not isinstance(participants, list):
+            raise ValueError("participants must be a list, not %s" % type(participants).__name__)
+        participants = map(_participant, participants)
+        return _build_session(data, ParticipantColumns(participants) if columnar
+                              else list(participants))
+
+
+def load_session(source, columnar=False):
+    # A path or stream, decoded a participant at a time
+    streamed = open_session(source)
+    participants = ParticipantColumns() if columnar else []
+    with _gc_paused():
+        for entry in streamed['participants']:
+            participants.append(Participant.from_dict(entry))
+    return _build_session(streamed.header, participants)
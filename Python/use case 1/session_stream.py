@@ -0,0 +1,337 @@
+"""Read a training session document without loading its participants list.
+
+    session = open_session('session.json')      # a path, or any object with read()
+    session["name"], session["instructor"]["name"]
+    for participant in session["participants"]:
+        ...
+
+The top-level object is parsed key by key. Every value except
+"participants" is decoded whole and kept, since those are small. When the
+parser reaches the participants array, it stops there. Iterating over
+session["participants"] then decodes one entry at a time from a buffer of
+about chunk_size characters. However many participants the document holds,
+memory stays at one participant plus one buffer.
+
+Exports usually put the participants last. When one of name, date,
+completed or instructor comes after the array, open_session needs it up
+front, so:
+- With a path, it skips over the array once, without keeping the entries,
+  to read the remaining keys. It then reopens the file for iteration.
+- With a stream (a socket's makefile(), stdin, ...), there is no going
+  back. Those keys appear in the session once the participants have been
+  read, and looking one up before that raises KeyError.
+
+Streams may be text or binary; binary data is decoded as UTF-8.
+
+    python session_stream.py --check
+
+reads a few documents, from a path and from a stream, with every buffer
+size from 1 to 64 characters, and checks they match json.loads. Small
+buffers cut numbers, strings and separators at every position.
+"""
+import argparse
+import codecs
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+# Top-level keys use_case1.py reads before the participants
+HEADER_KEYS = ('name', 'date', 'completed', 'instructor')
+
+PARTICIPANTS_KEY = 'participants'
+
+WHITESPACE = ' \t\n\r'
+
+# The ',' or ']' after an array entry, with the whitespace around it
+ARRAY_SEPARATOR = re.compile(r'[ \t\n\r]*([,\]])[ \t\n\r]*')
+
+# Characters that can continue a JSON number
+NUMBER_TAIL = re.compile(r'[0-9.eE+-]*')
+
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    # A window of the stream with a read position; JSON values are decoded
+    # from it with raw_decode and the consumed text is dropped on refill
+
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.utf8 = None
+
+    def fill(self, size=None):
+        # Read more; False once the stream is exhausted
+        if self.eof:
+            return False
+        while True:
+            data = self.stream.read(size or self.chunk_size)
+            if not isinstance(data, bytes):
+                break
+            if self.utf8 is None:
+                self.utf8 = codecs.getincrementaldecoder('utf-8')()
+            raw = data
+            data = self.utf8.decode(raw, final=not raw)
+            # a read that ends inside a multi-byte character decodes to
+            # nothing yet; that is not the end of the stream
+            if data or not raw:
+                break
+        if not data:
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return not self.eof
+
+    def peek(self):
+        # Next non-whitespace character, '' at the end of the stream
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError("expected %s, found %s" % (
+                " or ".join(repr(c) for c in chars), repr(char) if char else "end of stream"))
+        self.pos += 1
+        return char
+
+    def value(self):
+        # Decode the next JSON value. A value that runs into the end of the
+        # buffer may be cut short (a number, or an error on a partial
+        # string), so read more and try again, twice as much each time. A
+        # number cut right after its "." or "e" decodes as the digits before
+        # it, so a number only counts as whole if its tail ends in the buffer.
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+                whole = end < len(self.buffer)
+                if whole and self.buffer[self.pos] in '-0123456789':
+                    whole = NUMBER_TAIL.match(self.buffer, end).end() < len(self.buffer)
+                if whole or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill(size)
+            size *= 2
+
+    def skip_array(self):
+        # Decode and drop the rest of an array whose '[' was consumed
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            self.value()
+            if self.expect(',]') == ']':
+                return
+
+    def iter_array(self):
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        scan = _decoder.scan_once
+        separator = ARRAY_SEPARATOR.match
+        while True:
+            # Entries that end, separator included, inside the buffer are
+            # decoded in this loop; value() and expect() only handle the
+            # one that runs into the end of the buffer
+            buffer, pos = self.buffer, self.pos
+            while True:
+                try:
+                    value, end = scan(buffer, pos)
+                except (StopIteration, json.JSONDecodeError):
+                    break
+                match = separator(buffer, end)
+                if match is None or match.end() == len(buffer):
+                    break
+                self.pos = match.end()
+                yield value
+                if match.group(1) == ']':
+                    return
+                pos = self.pos
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+    def object_rest(self, found):
+        # Keys and values after the participants array, up to the closing
+        # '}' of the top-level object
+        if self.expect(',}') == '}':
+            return self.end()
+        while True:
+            key = self.value()
+            self.expect(':')
+            found[key] = self.value()
+            if self.expect(',}') == '}':
+                return self.end()
+
+    def end(self):
+        if self.peek():
+            raise ValueError("unexpected data after the session object")
+
+
+def _open_stream(source):
+    return open(source, 'rb') if isinstance(source, str) else source
+
+
+def _seek_participants(reader, header):
+    # Read top-level keys into header until the participants array; True
+    # with the reader just inside its '[', False if there is none
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.pos += 1
+        reader.end()
+        return False
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == PARTICIPANTS_KEY and reader.peek() == '[':
+            reader.pos += 1
+            return True
+        header[key] = reader.value()
+        if reader.expect(',}') == '}':
+            reader.end()
+            return False
+
+
+class StreamedSession:
+    def __init__(self, source, chunk_size=DEFAULT_CHUNK_SIZE):
+        # source: a path, reopened when needed, or a stream read only once
+        self.source = source
+        self.chunk_size = chunk_size
+        self.header = {}
+        self._reader = None
+        self._started = False
+
+        stream = _open_stream(source)
+        reader = _Reader(stream, chunk_size)
+        if not _seek_participants(reader, self.header):
+            self.header.setdefault(PARTICIPANTS_KEY, [])
+            self._close(stream)
+            return
+        self._reader = reader
+
+        if isinstance(source, str) and any(key not in self.header for key in HEADER_KEYS):
+            # a path: skip the array once to reach the keys after it
+            reader.skip_array()
+            reader.object_rest(self.header)
+            stream.close()
+            self._reader = None
+
+    def _close(self, stream):
+        if isinstance(self.source, str):
+            stream.close()
+
+    def _participants_reader(self):
+        if self._reader is not None and not self._started:
+            return self._reader
+        if not isinstance(self.source, str):
+            raise RuntimeError("the participants of a stream can only be read once")
+        reader = _Reader(_open_stream(self.source), self.chunk_size)
+        _seek_participants(reader, {})
+        return reader
+
+    def participants(self):
+        # Yields the participants one at a time
+        if PARTICIPANTS_KEY in self.header:
+            yield from self.header[PARTICIPANTS_KEY]
+            return
+        reader = self._participants_reader()
+        self._started = True
+        try:
+            yield from reader.iter_array()
+            trailing = {}
+            reader.object_rest(trailing)
+            for key, value in trailing.items():
+                self.header.setdefault(key, value)
+        finally:
+            self._close(reader.stream)
+            if reader is self._reader:
+                self._reader = None
+
+    def __getitem__(self, key):
+        if key == PARTICIPANTS_KEY and key not in self.header:
+            return self.participants()
+        return self.header[key]
+
+    def __contains__(self, key):
+        return key in self.header or key == PARTICIPANTS_KEY
+
+
+def open_session(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    return StreamedSession(source, chunk_size)
+
+
+# Documents for --check: numbers with fractions and exponents in the header,
+# in the participants, and after the participants
+CHECK_DOCUMENTS = [
+    {"name": "Python Training", "score": 12.75, "date": "April 19, 2024",
+     "completed": True, "instructor": {"name": "XYZ", "website": "http://pqr.com/"},
+     "participants": [{"name": "Participant 1", "email": "email1@example.com"},
+                      {"name": "Participant 2", "email": "email2@example.com"}]},
+    {"name": "Numbers", "participants": [1, 2.5e10, 333, -0.5e-3, 0, 7E+2],
+     "date": "", "completed": False, "instructor": {}, "ratio": -1.25e-7},
+    {"participants": []},
+]
+
+
+def check(chunk_sizes=range(1, 65)):
+    # (document, indent, source, chunk size, error) for every read that
+    # differs from json.loads
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'session.json')
+        for number, document in enumerate(CHECK_DOCUMENTS):
+            for indent in (None, 2):
+                text = json.dumps(document, indent=indent)
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                for chunk_size in chunk_sizes:
+                    for kind, source in (('path', path),
+                                         ('stream', io.BytesIO(text.encode('utf-8')))):
+                        try:
+                            session = open_session(source, chunk_size)
+                            found = {PARTICIPANTS_KEY: list(session[PARTICIPANTS_KEY])}
+                            found.update(session.header)
+                            error = None if found == document else "read %r" % (found,)
+                        except ValueError as exc:
+                            error = str(exc)
+                        if error:
+                            failures.append((number, indent, kind, chunk_size, error))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--check', action='store_true',
+                        help='check open_session against json.loads with small buffers')
+    args = parser.parse_args()
+    if not args.check:
+        parser.error('nothing to do without --check')
+    failures = check()
+    for number, indent, kind, chunk_size, error in failures:
+        print("document %d, indent %s, %s, chunk_size %d: %s" % (
+            number, indent, kind, chunk_size, error))
+    if failures:
+        sys.exit(1)
+    print("ok")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,8 @@
 # json 
 import json
+import sys
+
+from session_stream import open_session
 
 training_session_json = '''
 {
@@ -23,7 +26,12 @@ training_session_json = '''
 }
 '''
 
-training_session = json.loads(training_session_json)
+# With a file argument ("-" for stdin) the session is streamed, so the
+# participants are read one at a time instead of all at once
+if len(sys.argv) > 1:
+    training_session = open_session(sys.stdin.buffer if sys.argv[1] == "-" else sys.argv[1])
+else:
+    training_session = json.loads(training_session_json)
 
 name = training_session["name"]
 date = training_session["date"]
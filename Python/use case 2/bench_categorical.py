@@ -0,0 +1,94 @@
+"""String keys against shared categoricals for the merge and domain groupby.
+
+Usage:
+    python bench_categorical.py [--rows 1000000] [--seed 0]
+
+Writes synthetic god and goddess CSVs of --rows rows each (a few rows have
+no Domain). It then loads, merges and groups them twice: with pd.read_csv's
+default string columns, and after shared_categories.encode_shared. Times
+and memory are printed for each stage, and the two runs' results are
+checked to be equal.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from bench_vectorized import synthetic_tables
+from greek_gods_vectorized import domain_mean_ages, load, merge_tables
+from shared_categories import encode_shared
+
+
+def megabytes(*frames):
+    # Like memory_usage(deep=True), but categories shared between columns
+    # and frames are only counted once
+    seen = set()
+    total = 0
+    for frame in frames:
+        for _, column in frame.items():
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                total += column.cat.codes.nbytes
+                categories = column.cat.categories
+                if id(categories) not in seen:
+                    seen.add(id(categories))
+                    total += categories.memory_usage(deep=True)
+            else:
+                total += column.memory_usage(deep=True, index=False)
+    return total / 1e6
+
+
+def run(name, paths, encode=None):
+    timings = {}
+
+    def stage(label, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        timings[label] = time.perf_counter() - start
+        return result
+
+    gods, goddesses = stage('read', load, *paths)
+    timings['encode'] = 0.0
+    if encode:
+        gods, goddesses = stage('encode', encode, gods, goddesses)
+    merged = stage('merge', merge_tables, gods, goddesses)
+    means = stage('groupby', domain_mean_ages, merged)
+    print("%-12s read %5.2f s  encode %5.2f s  %7.1f MB   merge %5.2f s %7.1f MB   "
+          "groupby %5.2f s" % (
+              name, timings['read'], timings['encode'], megabytes(gods, goddesses),
+              timings['merge'], megabytes(merged), timings['groupby']))
+    return merged, means
+
+
+def as_strings(frame):
+    # categorical columns back to plain values, for comparing the two runs
+    return frame.apply(lambda column: column.astype(object)
+                       if isinstance(column.dtype, pd.CategoricalDtype) else column)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = (os.path.join(tmp, 'gods.csv'), os.path.join(tmp, 'goddesses.csv'))
+        rng = np.random.default_rng(args.seed)
+        for frame, path in zip(synthetic_tables(args.rows, args.seed), paths):
+            frame.loc[rng.integers(0, args.rows, 10), 'Domain'] = np.nan
+            frame.to_csv(path, index=False)
+
+        merged, means = run('strings', paths)
+        cat_merged, cat_means = run('categorical', paths, encode_shared)
+
+    pd.testing.assert_frame_equal(as_strings(merged), as_strings(cat_merged), check_dtype=False)
+    pd.testing.assert_frame_equal(means, cat_means.set_axis(cat_means.index.astype(object)),
+                                  check_index_type=False)
+    print("merged tables and domain means match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Load time of a large gods CSV: pd.read_csv against columnar_cache.
+
+Usage:
+    python bench_columnar_cache.py [--rows 5000000] [--domains 1000] [--format feather]
+
+Writes a synthetic CSV shaped like greek_gods.csv, then times a plain
+pd.read_csv, the first read_csv_cached call (parse and write the cache) and
+a second one (memory-map the cache), and compares the frames' memory use.
+"""
+import argparse
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+import columnar_cache
+from bench_vectorized import SYMBOLS
+from columnar_cache import read_csv_cached
+
+
+def write_csv(path, rows, domains, seed=0):
+    rng = np.random.default_rng(seed)
+    pd.DataFrame({
+        'God': 'God ' + pd.Series(np.arange(rows)).astype(str),
+        'Domain': 'God of Domain ' + pd.Series(rng.integers(0, domains, rows)).astype(str),
+        'Symbol': np.array(SYMBOLS)[rng.integers(0, len(SYMBOLS), rows)],
+        'Age': rng.integers(1000, 12000, rows),
+    }).to_csv(path, index=False)
+
+
+def timed(name, load):
+    start = time.perf_counter()
+    frame = load()
+    elapsed = time.perf_counter() - start
+    print("%-22s %8.3f s   %8.1f MB in memory" % (
+        name, elapsed, frame.memory_usage(deep=True).sum() / 1e6))
+    return frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000000)
+    parser.add_argument("--domains", type=int, default=1000)
+    parser.add_argument("--format", choices=("feather", "parquet"), default="feather")
+    parser.add_argument("--csv", default="bench_gods.csv")
+    parser.add_argument("--cache-dir", default="bench_columnar_cache")
+    args = parser.parse_args()
+    if columnar_cache.pyarrow is None:
+        # read_csv_cached would just parse the CSV each time
+        raise SystemExit("pyarrow is not installed, so there is no cache to benchmark")
+
+    write_csv(args.csv, args.rows, args.domains)
+    shutil.rmtree(args.cache_dir, ignore_errors=True)
+    print("%s: %d rows, %.1f MB" % (args.csv, args.rows, os.path.getsize(args.csv) / 1e6))
+
+    plain = timed("pd.read_csv", lambda: pd.read_csv(args.csv))
+    cold = timed("cached, first call", lambda: read_csv_cached(args.csv, args.cache_dir, args.format))
+    warm = timed("cached, second call", lambda: read_csv_cached(args.csv, args.cache_dir, args.format))
+    print("dtypes:", dict(warm.dtypes.astype(str)))
+
+    pd.testing.assert_frame_equal(cold, warm)
+    for column in plain:
+        assert (plain[column] == warm[column].astype(plain[column].dtype)).all(), column
+    os.remove(args.csv)
+    shutil.rmtree(args.cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Row-at-a-time steps of greek_gods_exam.py against greek_gods_vectorized.
+
+Usage:
+    python bench_vectorized.py [--rows 10000000] [--loop-rows 100000] [--seed 0]
+
+Synthetic god and goddess tables of --rows rows each are generated, with
+domains drawn from as many values as there are rows: most domains appear in
+both tables, some repeat and some are missing from one side, so the outer
+merge has matched and unmatched rows. The exam script's loops (apply,
+iterrows, while/iloc) cost minutes per million rows, so they run on
+--loop-rows rows only. Their results are checked against the vectorized steps on the same
+tables, and their time at --rows is extrapolated from the time per row.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from greek_gods_vectorized import age_groups, entity_names, merge_tables, oldest_entity, older_than
+
+SYMBOLS = ['Thunderbolt', 'Trident', 'Peacock', 'Owl', 'Helmet', 'Dove',
+           'Bow and Arrow', 'Wheat', 'Fire']
+
+
+def synthetic_tables(rows, seed=0):
+    rng = np.random.default_rng(seed)
+
+    def table(name_column, prefix):
+        ids = pd.Series(np.arange(rows)).astype(str)
+        return pd.DataFrame({
+            name_column: prefix + ids,
+            'Domain': 'Domain ' + pd.Series(rng.integers(0, rows, rows)).astype(str),
+            'Symbol': pd.Categorical.from_codes(rng.integers(0, len(SYMBOLS), rows), SYMBOLS),
+            'Age': rng.integers(1000, 12000, rows),
+        })
+
+    return table('God', 'God '), table('Goddess', 'Goddess ')
+
+
+# The exam script's versions of the three steps
+
+def categorize_age(age):
+    if age < 5000:
+        return 'Young'
+    elif 5000 <= age <= 8000:
+        return 'Middle-aged'
+    else:
+        return 'Old'
+
+
+def loop_age_groups(ages):
+    return ages.apply(categorize_age)
+
+
+def loop_names(merged):
+    names = []
+    for index, row in older_than(merged).iterrows():
+        names.append(row['God'] if pd.notna(row['God']) else row['Goddess'])
+    return names
+
+
+def loop_oldest(merged):
+    merged = merged.assign(Age=merged[['Age_god', 'Age_goddess']].max(axis=1))
+    oldest_name = None
+    oldest_age = None
+    i = 0
+    while i < len(merged):
+        row = merged.iloc[i]
+        if oldest_age is None or row['Age'] > oldest_age:
+            oldest_age = row['Age']
+            oldest_name = row['God'] if pd.notna(row['God']) else row['Goddess']
+        i += 1
+    return oldest_name, oldest_age
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def run_steps(gods, merged, vectorized):
+    # {step: (result, seconds, rows processed)}
+    if vectorized:
+        steps = (('age groups', age_groups, gods['Age']),
+                 ('names > 8000', lambda m: list(entity_names(older_than(m))), merged),
+                 ('oldest', oldest_entity, merged))
+    else:
+        steps = (('age groups', loop_age_groups, gods['Age']),
+                 ('names > 8000', loop_names, merged),
+                 ('oldest', loop_oldest, merged))
+    results = {}
+    for name, func, data in steps:
+        result, seconds = timed(func, data)
+        results[name] = (result, seconds, len(data))
+    return results
+
+
+def same(a, b):
+    if isinstance(a, pd.Series):
+        return a.astype(object).equals(b.astype(object))
+    return a == b
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000000)
+    parser.add_argument("--loop-rows", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Correctness: both versions on the same small tables
+    gods, goddesses = synthetic_tables(args.loop_rows, args.seed)
+    merged = merge_tables(gods, goddesses)
+    loops = run_steps(gods, merged, vectorized=False)
+    small = run_steps(gods, merged, vectorized=True)
+    for step in loops:
+        if not same(loops[step][0], small[step][0]):
+            raise SystemExit("%s: results differ" % step)
+    print("results match on %d-row tables (%d merged rows)" % (args.loop_rows, len(merged)))
+    del gods, goddesses, merged
+
+    start = time.perf_counter()
+    gods, goddesses = synthetic_tables(args.rows, args.seed)
+    merged = merge_tables(gods, goddesses)
+    print("generated and merged %d-row tables (%d merged rows) in %.1f s" % (
+        args.rows, len(merged), time.perf_counter() - start))
+    large = run_steps(gods, merged, vectorized=True)
+
+    print()
+    print("%-14s %14s %14s %10s" % ("step", "loop (est.)", "vectorized", "speedup"))
+    for step, (_, seconds, rows) in large.items():
+        _, loop_seconds, loop_rows = loops[step]
+        estimate = loop_seconds / loop_rows * rows
+        print("%-14s %12.2f s %12.3f s %9.0fx" % (step, estimate, seconds, estimate / seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Columnar (Feather/Parquet) cache for the gods and goddesses CSVs.
+
+Usage:
+    python columnar_cache.py [--format feather|parquet]   # the exam report from the cache
+
+read_csv_cached parses a CSV once, with explicit dtypes: Domain and Symbol
+as categoricals and Age as the narrowest integer type that holds every
+value (float64, as read_csv has it, if an age is missing). It stores the
+result in CACHE_DIR next to the source. The cache file is named after a
+SHA-256 of the source's contents, so an edited CSV gets a new file. The
+hash itself is remembered together with the source's size and mtime, so an
+untouched CSV is never read again, let alone parsed. Feather files are
+written uncompressed and memory-mapped when read, so loading one costs
+little more than converting the columns to pandas.
+
+The cache needs the optional pyarrow package. Without it read_csv_cached
+parses the CSV every time, still with the same dtypes.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+
+import pandas as pd
+
+import greek_gods_vectorized
+
+try:
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+CACHE_DIR = ".columnar_cache"
+INDEX_FILE = "index.json"
+
+CATEGORICAL_COLUMNS = ('Domain', 'Symbol')
+
+FORMATS = ('feather', 'parquet')
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_index(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, INDEX_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_index(cache_dir, index):
+    path = os.path.join(cache_dir, INDEX_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def source_hash(path, cache_dir):
+    # SHA-256 of path, only recomputed when its size or mtime changed
+    stat = os.stat(path)
+    index = load_index(cache_dir)
+    key = os.path.abspath(path)
+    entry = index.get(key)
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['sha256']
+    digest = file_hash(path)
+    index[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+    save_index(cache_dir, index)
+    return digest
+
+
+def narrow_ages(ages):
+    # Smallest integer type that fits. With a missing age the column stays
+    # float64, as read_csv parses it: a nullable integer type would print
+    # <NA> and 10000 where the exam script prints NaN and 10000.0.
+    if ages.isna().any():
+        return ages
+    return pd.to_numeric(ages, downcast='integer')
+
+
+def parse_csv(path):
+    header = pd.read_csv(path, nrows=0).columns
+    dtypes = {column: 'category' for column in CATEGORICAL_COLUMNS if column in header}
+    frame = pd.read_csv(path, dtype=dtypes)
+    if 'Age' in frame:
+        frame['Age'] = narrow_ages(frame['Age'])
+    return frame
+
+
+def cache_path(path, digest, cache_dir, format):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, "%s-%s.%s" % (name, digest[:16], format))
+
+
+def write_cache(frame, path, format):
+    # Write to a temporary name first so a reader never sees half a file
+    tmp = path + '.tmp'
+    if format == 'feather':
+        # uncompressed, so the file can be memory-mapped as is
+        frame.to_feather(tmp, compression='uncompressed')
+    else:
+        frame.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def read_cache(path, format):
+    if format == 'feather':
+        table = pyarrow.feather.read_table(path, memory_map=True)
+    else:
+        table = pyarrow.parquet.read_table(path, memory_map=True)
+    return table.to_pandas()
+
+
+def remove_stale(path, digest, cache_dir, format):
+    # Cache files of earlier versions of the same CSV. Only names cache_path
+    # could have given it count: a plain prefix match would also take
+    # greek_gods-2020.csv's files for greek_gods.csv's.
+    name = os.path.splitext(os.path.basename(path))[0]
+    stale = re.compile(re.escape(name) + r'-[0-9a-f]{16}\.' + re.escape(format))
+    keep = os.path.basename(cache_path(path, digest, cache_dir, format))
+    for entry in os.listdir(cache_dir):
+        if stale.fullmatch(entry) and entry != keep:
+            os.remove(os.path.join(cache_dir, entry))
+
+
+def read_csv_cached(path, cache_dir=None, format='feather'):
+    if format not in FORMATS:
+        raise ValueError("unknown cache format: %r" % format)
+    if pyarrow is None:
+        return parse_csv(path)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    digest = source_hash(path, cache_dir)
+    cached = cache_path(path, digest, cache_dir, format)
+    if os.path.exists(cached):
+        return read_cache(cached, format)
+    frame = parse_csv(path)
+    write_cache(frame, cached, format)
+    remove_stale(path, digest, cache_dir, format)
+    return frame
+
+
+def load(gods_path='greek_gods.csv', goddesses_path='greek_goddesses.csv',
+         cache_dir=None, format='feather'):
+    # Drop-in for greek_gods_vectorized.load
+    return (read_csv_cached(gods_path, cache_dir, format),
+            read_csv_cached(goddesses_path, cache_dir, format))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--format", choices=FORMATS, default='feather')
+    args = parser.parse_args()
+
+    greek_gods_vectorized.main(lambda: load(format=args.format))
+
+
+if __name__ == "__main__":
+    main()
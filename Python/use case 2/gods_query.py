@@ -0,0 +1,291 @@
+"""The greek_gods_exam analyses as lazy, profiled queries.
+
+    engine = Engine('greek_gods.csv', 'greek_goddesses.csv')
+    older = engine.merged().older_than(8000).sort_by_age()
+    means = engine.merged().domain_mean_ages()
+    older_df, means_df = engine.collect(older, means)
+    print(engine.profile_report())
+
+Building a query only records its steps (merge -> filter -> sort -> group,
+or one of the per-table steps). collect() plans every query it is given
+together:
+
+- Each CSV is read once per collect, with only the columns some query
+  needs. Queries that end in an aggregate read just what it uses, e.g.
+  Domain and Age for domain_mean_ages.
+- All merge queries share one merged frame.
+- When no query needs the full merge, an older_than() at the start of a
+  query is pushed below the outer merge. Both inputs are cut down to the
+  domains where someone is old enough, the merge runs on what is left, and
+  the filter is then applied to the merged rows. The rows come out the same
+  and in the same order; only their index labels differ.
+- Queries that start with the same steps share the results of those steps.
+
+Every step is timed; profile_report() lists the steps with their row counts.
+Running this file prints the exam report through the engine.
+"""
+import time
+
+import pandas as pd
+
+from greek_gods_vectorized import (SEPARATOR, age_groups, domain_mean_ages, entity_names,
+                                   merge_tables, oldest_by_kind, oldest_entity, older_than,
+                                   sort_by_age)
+
+# Columns of each input, by role; the name column is God or Goddess
+ALL_COLUMNS = frozenset(('name', 'Domain', 'Symbol', 'Age'))
+
+# Steps that return a frame the caller sees, so it keeps all its columns
+FRAME_STEPS = ('older_than', 'sort_by_age', 'age_groups')
+
+# Columns each aggregate step reads
+STEP_COLUMNS = {
+    'older_than': {'Age'},
+    'sort_by_age': {'Age'},
+    'domain_mean_ages': {'Domain', 'Age'},
+    'oldest_by_kind': {'name', 'Age'},
+    'names': {'name', 'Age'},
+    'oldest': {'name', 'Age'},
+    'mean_age': {'Age'},
+}
+
+MERGED_STEPS = ('older_than', 'sort_by_age', 'domain_mean_ages', 'oldest_by_kind',
+                'names', 'oldest')
+TABLE_STEPS = ('age_groups', 'mean_age')
+
+
+class Query:
+    # An immutable chain of steps over one source: 'merged', 'gods' or
+    # 'goddesses'. Each method returns a new, longer query.
+
+    def __init__(self, source, steps=()):
+        self.source = source
+        self.steps = steps
+
+    def _then(self, step, *args):
+        allowed = MERGED_STEPS if self.source == 'merged' else TABLE_STEPS
+        if step not in allowed:
+            raise ValueError("%s is not a step of %s queries" % (step, self.source))
+        if self.steps and self.steps[-1][0] not in FRAME_STEPS:
+            raise ValueError("%s comes after %s, which does not return a frame"
+                             % (step, self.steps[-1][0]))
+        return Query(self.source, self.steps + ((step,) + args,))
+
+    def older_than(self, age=8000):
+        return self._then('older_than', age)
+
+    def sort_by_age(self):
+        return self._then('sort_by_age')
+
+    def domain_mean_ages(self):
+        return self._then('domain_mean_ages')
+
+    def oldest_by_kind(self):
+        return self._then('oldest_by_kind')
+
+    def names(self):
+        return self._then('names')
+
+    def oldest(self):
+        return self._then('oldest')
+
+    def age_groups(self):
+        return self._then('age_groups')
+
+    def mean_age(self):
+        return self._then('mean_age')
+
+    def columns(self):
+        # Columns (by role) the query needs from each input it reads
+        if not self.steps or self.steps[-1][0] in FRAME_STEPS:
+            return set(ALL_COLUMNS)
+        needed = set()
+        for step in self.steps:
+            needed |= STEP_COLUMNS[step[0]]
+        if self.source == 'merged':
+            needed.add('Domain')
+        return needed
+
+    def pushdown_age(self):
+        # The age of a leading older_than() that could run below the merge
+        if self.source == 'merged' and self.steps and self.steps[0][0] == 'older_than':
+            return self.steps[0][1]
+        return None
+
+    def __repr__(self):
+        return "Query(%s%s)" % (self.source, "".join(
+            " -> %s%s" % (step[0], "(%s)" % step[1] if len(step) > 1 else "")
+            for step in self.steps))
+
+
+class Engine:
+    def __init__(self, gods_path='greek_gods.csv', goddesses_path='greek_goddesses.csv'):
+        self.paths = {'gods': gods_path, 'goddesses': goddesses_path}
+        self.headers = {}
+        # (step, detail, seconds, rows)
+        self.profile = []
+
+    def merged(self):
+        return Query('merged')
+
+    def gods(self):
+        return Query('gods')
+
+    def goddesses(self):
+        return Query('goddesses')
+
+    def _timed(self, step, detail, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        if isinstance(result, (pd.DataFrame, pd.Series, list)):
+            rows = len(result)
+        elif isinstance(result, tuple) and all(isinstance(r, pd.DataFrame) for r in result):
+            rows = sum(len(r) for r in result)
+        else:
+            rows = 1
+        self.profile.append((step, detail, elapsed, rows))
+        return result
+
+    def _header(self, table):
+        if table not in self.headers:
+            self.headers[table] = list(pd.read_csv(self.paths[table], nrows=0).columns)
+        return self.headers[table]
+
+    def _load(self, table, roles):
+        # Read only the columns for the given roles, in file order
+        header = self._header(table)
+        role_of = {column: ('name' if i == 0 else column) for i, column in enumerate(header)}
+        usecols = [column for column in header if role_of[column] in roles]
+        return self._timed('read', "%s [%s]" % (table, ", ".join(usecols)),
+                           lambda: pd.read_csv(self.paths[table], usecols=usecols))
+
+    def _pushdown_merge(self, gods, goddesses, age):
+        # Only domains where a god or a goddess is older than age can produce
+        # a row that survives the filter; drop the rest before merging
+        def cut():
+            domains = pd.concat([gods.loc[gods['Age'] > age, 'Domain'],
+                                 goddesses.loc[goddesses['Age'] > age, 'Domain']]).unique()
+            return gods[gods['Domain'].isin(domains)], goddesses[goddesses['Domain'].isin(domains)]
+
+        gods, goddesses = self._timed('pushdown', "older_than(%s) -> domain semi-join" % age, cut)
+        return self._timed('merge', "outer on Domain", merge_tables, gods, goddesses)
+
+    def _apply(self, frame, step):
+        name, args = step[0], step[1:]
+        if name == 'older_than':
+            return self._timed('filter', "older_than(%s)" % args[0], older_than, frame, *args)
+        if name == 'sort_by_age':
+            return self._timed('sort', "Age_god, Age_goddess desc", sort_by_age, frame)
+        if name == 'domain_mean_ages':
+            return self._timed('group', "Domain -> mean ages", domain_mean_ages, frame)
+        if name == 'oldest_by_kind':
+            return self._timed('aggregate', "oldest_by_kind", oldest_by_kind, frame)
+        if name == 'names':
+            return self._timed('project', "God or Goddess", lambda f: list(entity_names(f)), frame)
+        if name == 'oldest':
+            return self._timed('aggregate', "oldest", oldest_entity, frame)
+        if name == 'age_groups':
+            return self._timed('project', "Age_Group",
+                               lambda f: f.assign(Age_Group=age_groups(f['Age'])), frame)
+        if name == 'mean_age':
+            return self._timed('aggregate', "mean Age", lambda f: f['Age'].mean(), frame)
+        raise ValueError("unknown step: %r" % name)
+
+    def _run(self, base_key, frame, steps, memo):
+        # Steps a query shares with an earlier one in the same collect (same
+        # base, same steps so far) are not run again
+        for i, step in enumerate(steps):
+            key = (base_key, steps[:i + 1])
+            if key not in memo:
+                memo[key] = self._apply(frame, step)
+            frame = memo[key]
+        return frame
+
+    def collect(self, *queries):
+        # Run all queries with one shared plan; results in query order
+        roles = {'gods': set(), 'goddesses': set()}
+        for query in queries:
+            for table in (('gods', 'goddesses') if query.source == 'merged' else (query.source,)):
+                roles[table] |= query.columns()
+        tables = {table: self._load(table, needed) for table, needed in roles.items() if needed}
+
+        merge_queries = [query for query in queries if query.source == 'merged']
+        full_merge = any(query.pushdown_age() is None for query in merge_queries)
+        if full_merge:
+            merged = self._timed('merge', "outer on Domain", merge_tables,
+                                 tables['gods'], tables['goddesses'])
+        pushed = {}
+
+        memo = {}
+        results = []
+        for query in queries:
+            if query.source != 'merged':
+                results.append(self._run(query.source, tables[query.source], query.steps, memo))
+            elif full_merge:
+                results.append(self._run('merged', merged, query.steps, memo))
+            else:
+                # the older_than step still runs, on the smaller merge
+                age = query.pushdown_age()
+                if age not in pushed:
+                    pushed[age] = self._pushdown_merge(tables['gods'], tables['goddesses'], age)
+                results.append(self._run(('pushdown', age), pushed[age], query.steps, memo))
+        return results
+
+    def profile_report(self):
+        lines = ["%-10s %-48s %10s %10s" % ("step", "detail", "ms", "rows")]
+        for step, detail, seconds, rows in self.profile:
+            lines.append("%-10s %-48s %10.2f %10d" % (step, detail[:48], seconds * 1000, rows))
+        lines.append("%-10s %-48s %10.2f" % ("total", "", sum(p[2] for p in self.profile) * 1000))
+        return "\n".join(lines)
+
+    def reset_profile(self):
+        self.profile = []
+
+
+def report(engine):
+    # greek_gods_exam.py's printout, from one collect
+    merged = engine.merged()
+    filtered = merged.older_than(8000).sort_by_age()
+    (merged_table, filtered_table, means, oldest, gods, goddesses, gods_mean,
+     goddesses_mean, names, oldest_overall) = engine.collect(
+        merged, filtered, merged.domain_mean_ages(), filtered.oldest_by_kind(),
+        engine.gods().age_groups(), engine.goddesses().age_groups(),
+        engine.gods().mean_age(), engine.goddesses().mean_age(),
+        merged.older_than(8000).names(), merged.oldest())
+
+    print(merged_table)
+    print(SEPARATOR)
+    print(filtered_table)
+    print(SEPARATOR)
+    print(means)
+    print(SEPARATOR)
+    if oldest is None:
+        print("There is no god/goddess with the highest age.")
+    else:
+        print(f"The oldest is {oldest[0]} ({oldest[1]}) with an age of {oldest[2]} years.")
+    print(SEPARATOR)
+    print(gods)
+    print()
+    print(goddesses)
+    print(SEPARATOR)
+    age_difference = gods_mean - goddesses_mean
+    if age_difference > 0:
+        print("Yes there is a significant age difference and Gods tend to be older than goddesses.")
+    elif age_difference < 0:
+        print("Yes there is a significant age difference and Goddesses tend to be older than gods.")
+    else:
+        print("The average ages of gods and goddesses are the same.")
+    print(SEPARATOR)
+    print("Gods/Goddesses older than 8000 years:")
+    for name in names:
+        print(name)
+    print(SEPARATOR)
+    print(f"The oldest god/goddess is {oldest_overall[0]} with an age of {oldest_overall[1]} years.")
+
+
+if __name__ == "__main__":
+    engine = Engine()
+    report(engine)
+    print()
+    print(engine.profile_report())
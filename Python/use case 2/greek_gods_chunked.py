@@ -0,0 +1,201 @@
+"""Out-of-core merge, filter and per-domain mean ages for greek_gods_exam.
+
+Usage:
+    python greek_gods_chunked.py [--gods greek_gods.csv] [--goddesses greek_goddesses.csv]
+                                 [--out-dir .] [--partitions 16] [--chunksize 100000]
+                                 [--work-dir DIR] [--check]
+
+Both CSVs are read in chunks and hash-partitioned by Domain into files on
+disk, so every row of a given domain, from either file, ends up in the same
+partition. Each partition is then merged, filtered and grouped on its own,
+and its results are sorted and spilled back to disk. A final k-way merge
+streams them into filtered.csv (step 2 of the exam) and domain_mean_ages.csv
+(step 3). Peak memory is about one partition's worth of rows, however big
+the inputs are.
+
+The outer merge orders rows by Domain (missing domains last), the age sort
+is stable, and no domain spans two partitions, so merging the partitions on
+(ages, Domain) restores the in-memory order exactly. The files are the same,
+byte for byte, as the in-memory run's frames written with to_csv; --check
+does that and compares them.
+"""
+import argparse
+import filecmp
+import heapq
+import os
+import pickle
+import resource
+import tempfile
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+from greek_gods_vectorized import domain_mean_ages, load, merge_tables, older_than, sort_by_age
+
+# rows per pickled block of a spilled result, and per write of the output
+BLOCK_ROWS = 10000
+
+FILTERED_CSV = "filtered.csv"
+MEANS_CSV = "domain_mean_ages.csv"
+
+
+def partition_path(work_dir, name, partition):
+    return os.path.join(work_dir, "%s-%04d.pkl" % (name, partition))
+
+
+def hash_partition(path, work_dir, name, partitions, chunksize):
+    # Append each chunk's rows to the partition file of their Domain.
+    # Returns an empty frame with the file's columns and dtypes, for
+    # partitions that get no rows from this file.
+    template = None
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        if template is None:
+            template = chunk.head(0)
+        hashes = pd.util.hash_pandas_object(chunk['Domain'], index=False).to_numpy()
+        for partition, rows in chunk.groupby(hashes % np.uint64(partitions), sort=False):
+            # several pickles back to back; read_blocks loads them one by one
+            with open(partition_path(work_dir, name, partition), 'ab') as f:
+                pickle.dump(rows, f, pickle.HIGHEST_PROTOCOL)
+    if template is None:
+        template = pd.read_csv(path, nrows=0)
+    return template
+
+
+def read_blocks(path):
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def read_partition(work_dir, name, partition, template):
+    frames = list(read_blocks(partition_path(work_dir, name, partition)))
+    return pd.concat(frames) if frames else template
+
+
+def spill(frame, path):
+    with open(path, 'wb') as f:
+        for start in range(0, len(frame), BLOCK_ROWS):
+            pickle.dump(frame.iloc[start:start + BLOCK_ROWS], f, pickle.HIGHEST_PROTOCOL)
+
+
+def iter_rows(path):
+    for block in read_blocks(path):
+        yield from block.itertuples(index=False, name=None)
+
+
+def is_missing(value):
+    return value is None or value != value
+
+
+def descending(value):
+    # sort key for sort_values(ascending=False) with NaN last
+    return (1, 0) if is_missing(value) else (0, -value)
+
+
+def ascending(value):
+    return (1, '') if is_missing(value) else (0, value)
+
+
+def write_merged(paths, key, columns, dtypes, out_path):
+    # k-way merge the sorted spill files into one CSV, BLOCK_ROWS at a time
+    rows = heapq.merge(*(iter_rows(path) for path in paths), key=key)
+    first = True
+    with open(out_path, 'w', newline='') as f:
+        while True:
+            block = list(islice(rows, BLOCK_ROWS))
+            # an empty result still gets its header line
+            if not block and not first:
+                break
+            pd.DataFrame(block, columns=columns).astype(dtypes).to_csv(
+                f, header=first, index=False)
+            first = False
+
+
+def chunked_analysis(gods_path, goddesses_path, out_dir='.', partitions=16,
+                     chunksize=100000, work_dir=None):
+    # Writes FILTERED_CSV and MEANS_CSV to out_dir one partition at a time;
+    # returns the merged row count of the largest partition
+    # created up front so a new out_dir doesn't fail after all the work
+    os.makedirs(out_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        gods_template = hash_partition(gods_path, tmp, 'gods', partitions, chunksize)
+        goddesses_template = hash_partition(goddesses_path, tmp, 'goddesses', partitions, chunksize)
+
+        largest = 0
+        filtered_dtypes = []
+        for partition in range(partitions):
+            merged = merge_tables(read_partition(tmp, 'gods', partition, gods_template),
+                                  read_partition(tmp, 'goddesses', partition, goddesses_template))
+            largest = max(largest, len(merged))
+            filtered = sort_by_age(older_than(merged))
+            filtered_dtypes.append(filtered.dtypes)
+            spill(filtered, partition_path(tmp, 'filtered', partition))
+            spill(domain_mean_ages(merged).reset_index(), partition_path(tmp, 'means', partition))
+            del merged, filtered
+
+        # The in-memory frame has one dtype per column for all partitions
+        # (e.g. float ages as soon as any partition has a missing one)
+        dtypes = pd.concat([pd.DataFrame(columns=d.index).astype(d) for d in filtered_dtypes]).dtypes
+        columns = list(dtypes.index)
+        age_god, age_goddess, domain = (columns.index(name)
+                                        for name in ('Age_god', 'Age_goddess', 'Domain'))
+        write_merged(
+            [partition_path(tmp, 'filtered', p) for p in range(partitions)],
+            lambda row: (descending(row[age_god]), descending(row[age_goddess]),
+                         ascending(row[domain])),
+            columns, dtypes, os.path.join(out_dir, FILTERED_CSV))
+        write_merged(
+            [partition_path(tmp, 'means', p) for p in range(partitions)],
+            lambda row: row[0],
+            ['Domain', 'Age_god', 'Age_goddess'], {'Age_god': 'float64', 'Age_goddess': 'float64'},
+            os.path.join(out_dir, MEANS_CSV))
+    return largest
+
+
+def in_memory_analysis(gods_path, goddesses_path, out_dir='.'):
+    # The same two files from the exam script's in-memory steps
+    os.makedirs(out_dir, exist_ok=True)
+    merged = merge_tables(*load(gods_path, goddesses_path))
+    sort_by_age(older_than(merged)).to_csv(os.path.join(out_dir, FILTERED_CSV), index=False)
+    domain_mean_ages(merged).to_csv(os.path.join(out_dir, MEANS_CSV))
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--gods", default="greek_gods.csv")
+    parser.add_argument("--goddesses", default="greek_goddesses.csv")
+    parser.add_argument("--out-dir", default=".")
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--chunksize", type=int, default=100000)
+    parser.add_argument("--work-dir", help="where partition files go (default: system temp)")
+    parser.add_argument("--check", action="store_true",
+                        help="also run in memory and compare the output files")
+    args = parser.parse_args()
+
+    largest = chunked_analysis(args.gods, args.goddesses, args.out_dir, args.partitions,
+                               args.chunksize, args.work_dir)
+    print("wrote %s and %s; largest partition %d merged rows, peak RSS %.1f MB" % (
+        os.path.join(args.out_dir, FILTERED_CSV), os.path.join(args.out_dir, MEANS_CSV),
+        largest, peak_rss_mb()))
+
+    if args.check:
+        with tempfile.TemporaryDirectory() as expected:
+            in_memory_analysis(args.gods, args.goddesses, expected)
+            for name in (FILTERED_CSV, MEANS_CSV):
+                same = filecmp.cmp(os.path.join(args.out_dir, name),
+                                   os.path.join(expected, name), shallow=False)
+                print("%s %s the in-memory run" % (name, "matches" if same else "DIFFERS from"))
+
+
+if __name__ == "__main__":
+    main()
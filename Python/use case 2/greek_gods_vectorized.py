@@ -0,0 +1,140 @@
+"""The steps of greek_gods_exam.py without row-at-a-time Python.
+
+The exam script builds Age_Group with .apply(categorize_age), prints the
+names of the over-8000s from an iterrows() loop and finds the oldest entity
+with a while loop over merged_table.iloc[i]. Here the same results come from
+pd.cut, a God/Goddess combine_first and idxmax, so the cost per row stays in
+pandas/NumPy. Running this file prints the same report as the exam script.
+"""
+import numpy as np
+import pandas as pd
+
+# categorize_age: Young below 5000, Middle-aged from 5000 to 8000 inclusive,
+# Old above. With right=False the bins are [lo, hi), so the middle bin ends
+# just past 8000 to keep 8000 itself Middle-aged.
+AGE_BINS = [-np.inf, 5000, np.nextafter(8000, np.inf), np.inf]
+AGE_GROUPS = ['Young', 'Middle-aged', 'Old']
+
+SEPARATOR = "*" * 128
+
+
+def load(gods_path='greek_gods.csv', goddesses_path='greek_goddesses.csv'):
+    return pd.read_csv(gods_path), pd.read_csv(goddesses_path)
+
+
+def merge_tables(gods, goddesses):
+    domains = gods['Domain']
+    if isinstance(domains.dtype, pd.CategoricalDtype) and domains.dtype == goddesses['Domain'].dtype:
+        # Join on the integer codes. Missing domains (code -1) become the
+        # highest code, so they sort last as they do in a string merge.
+        dtype = domains.dtype
+        missing = len(dtype.categories)
+
+        def codes(frame):
+            keys = frame['Domain'].cat.codes.to_numpy()
+            return frame.assign(Domain=np.where(keys < 0, missing, keys))
+
+        merged = pd.merge(codes(gods), codes(goddesses), how='outer', on='Domain',
+                          suffixes=('_god', '_goddess'))
+        keys = merged['Domain'].to_numpy()
+        merged['Domain'] = pd.Categorical.from_codes(np.where(keys == missing, -1, keys),
+                                                     dtype=dtype)
+        return merged
+    return pd.merge(gods, goddesses, how='outer', left_on='Domain', right_on='Domain',
+                    suffixes=('_god', '_goddess'))
+
+
+def older_than(merged, age=8000):
+    return merged[(merged['Age_god'] > age) | (merged['Age_goddess'] > age)]
+
+
+def sort_by_age(frame):
+    return frame.sort_values(by=['Age_god', 'Age_goddess'], ascending=False)
+
+
+def domain_mean_ages(merged):
+    return merged.groupby('Domain')[['Age_god', 'Age_goddess']].mean()
+
+
+def oldest_by_kind(frame):
+    # (name, 'God' or 'Goddess', age) of the oldest, or None on a tie
+    max_age_god = frame['Age_god'].max()
+    max_age_goddess = frame['Age_goddess'].max()
+    if max_age_god > max_age_goddess:
+        return frame.loc[frame['Age_god'].idxmax(), 'God'], 'God', max_age_god
+    if max_age_goddess > max_age_god:
+        return frame.loc[frame['Age_goddess'].idxmax(), 'Goddess'], 'Goddess', max_age_goddess
+    return None
+
+
+def age_groups(ages):
+    groups = pd.cut(ages, AGE_BINS, labels=AGE_GROUPS, right=False)
+    # categorize_age puts anything that fails both comparisons (NaN) in Old
+    return groups.fillna('Old')
+
+
+def entity_names(merged):
+    # The god's name, or the goddess's where the row has no god
+    return merged['God'].combine_first(merged['Goddess'])
+
+
+def oldest_entity(merged):
+    # (name, age) of the first row with the highest age, as the while loop
+    # finds it (it only moves on for a strictly greater age)
+    ages = merged[['Age_god', 'Age_goddess']].max(axis=1)
+    # If the first row has no age, the loop starts from NaN, which no age is
+    # greater than, so it keeps that row
+    row = ages.index[0] if pd.isna(ages.iloc[0]) else ages.idxmax()
+    god = merged.at[row, 'God']
+    return (god if pd.notna(god) else merged.at[row, 'Goddess']), ages[row]
+
+
+def main(load_tables=load):
+    gods, goddesses = load_tables()
+
+    merged_table = merge_tables(gods, goddesses)
+    print(merged_table)
+    print(SEPARATOR)
+
+    filtered_table = sort_by_age(older_than(merged_table))
+    print(filtered_table)
+    print(SEPARATOR)
+
+    print(domain_mean_ages(merged_table))
+    print(SEPARATOR)
+
+    oldest = oldest_by_kind(filtered_table)
+    if oldest is None:
+        print("There is no god/goddess with the highest age.")
+    else:
+        print(f"The oldest is {oldest[0]} ({oldest[1]}) with an age of {oldest[2]} years.")
+    print(SEPARATOR)
+
+    gods['Age_Group'] = age_groups(gods['Age'])
+    goddesses['Age_Group'] = age_groups(goddesses['Age'])
+    print(gods)
+    print()
+    print(goddesses)
+    print(SEPARATOR)
+
+    age_difference = gods['Age'].mean() - goddesses['Age'].mean()
+    if age_difference > 0:
+        print("Yes there is a significant age difference and Gods tend to be older than goddesses.")
+    elif age_difference < 0:
+        print("Yes there is a significant age difference and Goddesses tend to be older than gods.")
+    else:
+        print("The average ages of gods and goddesses are the same.")
+    print(SEPARATOR)
+
+    print("Gods/Goddesses older than 8000 years:")
+    for name in entity_names(older_than(merged_table)):
+        print(name)
+    print(SEPARATOR)
+
+    merged_table['Age'] = merged_table[['Age_god', 'Age_goddess']].max(axis=1)
+    oldest_name, oldest_age = oldest_entity(merged_table)
+    print(f"The oldest god/goddess is {oldest_name} with an age of {oldest_age} years.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""Per-domain age statistics (step 3 of greek_gods_exam) on a process pool.
+
+Usage:
+    python parallel_groupby.py [--gods greek_gods.csv] [--goddesses greek_goddesses.csv]
+                               [--workers N] [--percentiles 0.25,0.5,0.75] [--check]
+
+The merged table's Domain column is factorized to integer codes, and every
+domain is assigned to a shard by a hash of its code. The rows are
+reordered so each shard's rows are contiguous. Then the codes and the Age_god/Age_goddess
+columns are copied once into shared memory. Each worker gets only the
+names of the shared blocks and its row range, so no row data is pickled.
+
+A domain lives in exactly one shard, so a worker's partial results are
+final for its domains. Workers write them straight into a shared output
+block, indexed by domain code: count, sum, min and max, plus any requested
+percentiles. The parent combines them into the mean (sum / count) and the
+result frame.
+
+Count, sum, min and max come from one unsorted pass over a shard. Medians
+and other percentiles need the ages of each domain in order. Each worker
+therefore sorts its shard by (domain, age) once per column, and reads every
+statistic from that sorted pass. Percentiles interpolate linearly, as
+pandas' quantile does by default. Missing ages are skipped, and missing
+domains are dropped, as in groupby('Domain').
+
+--check also runs the pandas groupby on the same table, prints both
+timings and compares the results, with and without percentiles.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from greek_gods_vectorized import domain_mean_ages, load, merge_tables
+
+AGE_COLUMNS = ('Age_god', 'Age_goddess')
+
+# Rows of the output block before the percentiles
+SUMMARY_STATS = ('count', 'sum', 'min', 'max')
+
+DEFAULT_PERCENTILES = (0.25, 0.5, 0.75)
+
+
+def stat_name(q):
+    return 'median' if q == 0.5 else 'p%g' % (q * 100)
+
+
+def create_block(shape, dtype):
+    # A shared memory block and an array over it. The array must be dropped
+    # before the block is closed.
+    dtype = np.dtype(dtype)
+    size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+    block = shared_memory.SharedMemory(create=True, size=size)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def attach_block(name, shape, dtype):
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+
+def summary_pass(codes, ages, domains):
+    # count, sum, min and max of each domain in one pass over unsorted rows
+    present = np.flatnonzero(np.bincount(codes, minlength=domains))
+    valid = ~np.isnan(ages)
+    codes, ages = codes[valid], ages[valid]
+    counts = np.bincount(codes, minlength=domains)[present]
+    sums = np.bincount(codes, weights=ages, minlength=domains)[present]
+    lows = np.full(domains, np.inf)
+    highs = np.full(domains, -np.inf)
+    np.minimum.at(lows, codes, ages)
+    np.maximum.at(highs, codes, ages)
+    # a domain with rows but no ages in this column has no min or max
+    some = counts > 0
+    return present, [counts, sums, np.where(some, lows[present], np.nan),
+                     np.where(some, highs[present], np.nan)]
+
+
+def sorted_pass(codes, ages, quantiles):
+    # count, sum, min, max and the quantiles of each domain, from the ages
+    # sorted within each domain
+    valid = ~np.isnan(ages)
+    codes, ages = codes[valid], ages[valid]
+    order = np.lexsort((ages, codes))
+    codes, ages = codes[order], ages[order]
+    starts = np.flatnonzero(np.diff(codes, prepend=-1))
+    counts = np.diff(np.r_[starts, len(codes)])
+    # reduceat rejects an empty list of starts
+    sums = np.add.reduceat(ages, starts) if len(starts) else np.empty(0)
+    stats = [counts, sums, ages[starts], ages[starts + counts - 1]]
+    for q in quantiles:
+        position = (counts - 1) * q
+        low = np.floor(position).astype(np.intp)
+        high = np.ceil(position).astype(np.intp)
+        below, above = ages[starts + low], ages[starts + high]
+        stats.append(below + (above - below) * (position - low))
+    return codes[starts], stats
+
+
+def shard_stats(spec):
+    # Statistics of one shard's rows into the shared output block. Returns
+    # the number of rows it read.
+    (codes_name, ages_name, out_name, rows, domains, stats_count, start, stop,
+     quantiles) = spec
+    blocks = []
+    try:
+        block, all_codes = attach_block(codes_name, (rows,), np.int64)
+        blocks.append(block)
+        block, all_ages = attach_block(ages_name, (len(AGE_COLUMNS), rows), np.float64)
+        blocks.append(block)
+        block, out = attach_block(out_name, (stats_count, len(AGE_COLUMNS), domains), np.float64)
+        blocks.append(block)
+
+        codes = all_codes[start:stop]
+        for column in range(len(AGE_COLUMNS)):
+            ages = all_ages[column, start:stop]
+            if quantiles:
+                present, stats = sorted_pass(codes, ages, quantiles)
+            else:
+                present, stats = summary_pass(codes, ages, domains)
+            for index, values in enumerate(stats):
+                out[index, column, present] = values
+        del all_codes, all_ages, out, codes, ages
+    finally:
+        for block in blocks:
+            block.close()
+    return stop - start
+
+
+def shard_bounds(domain_shards, codes, workers):
+    # Order that makes each shard's rows contiguous, and each shard's
+    # (start, stop) in that order
+    row_shards = domain_shards[codes]
+    # a stable sort of small integers is a radix sort in NumPy
+    order = np.argsort(row_shards, kind='stable')
+    sizes = np.bincount(row_shards, minlength=workers)
+    ends = np.cumsum(sizes)
+    return order, [(int(end - size), int(end)) for size, end in zip(sizes, ends)]
+
+
+def domain_age_stats(merged, workers=None, percentiles=DEFAULT_PERCENTILES):
+    # One row per domain, sorted; columns (Age_god | Age_goddess, statistic)
+    # for count, mean, min, max and each percentile
+    workers = workers or os.cpu_count() or 1
+    quantiles = tuple(percentiles or ())
+
+    codes, domains = pd.factorize(merged['Domain'], sort=True)
+    keep = codes >= 0
+    codes = codes[keep].astype(np.int64)
+    ages = merged.loc[keep, list(AGE_COLUMNS)].to_numpy(dtype=np.float64).T
+
+    # Hashing the codes spreads the domains as well as hashing the strings
+    # would, for a fraction of the cost
+    hashes = pd.util.hash_array(np.arange(len(domains), dtype=np.int64))
+    domain_shards = (hashes % np.uint64(workers)).astype(np.int16)
+    order, bounds = shard_bounds(domain_shards, codes, workers)
+
+    stats_count = len(SUMMARY_STATS) + len(quantiles)
+    blocks = []
+    try:
+        codes_block, shared_codes = create_block(codes.shape, np.int64)
+        blocks.append(codes_block)
+        np.take(codes, order, out=shared_codes)
+        ages_block, shared_ages = create_block(ages.shape, np.float64)
+        blocks.append(ages_block)
+        np.take(ages, order, axis=1, out=shared_ages)
+        del codes, ages, order
+        out_block, out = create_block((stats_count, len(AGE_COLUMNS), len(domains)), np.float64)
+        blocks.append(out_block)
+        # domains a column has no age for keep NaN (count 0)
+        out[:] = np.nan
+        out[0] = 0
+
+        specs = [(codes_block.name, ages_block.name, out_block.name, len(shared_codes),
+                  len(domains), stats_count, start, stop, quantiles)
+                 for start, stop in bounds if stop > start]
+        if workers == 1:
+            for spec in specs:
+                shard_stats(spec)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(shard_stats, specs))
+
+        counts, sums = out[0], out[1]
+        columns = {}
+        for column, name in enumerate(AGE_COLUMNS):
+            columns[(name, 'count')] = counts[column].astype(np.int64)
+            columns[(name, 'mean')] = np.divide(sums[column], counts[column],
+                                                out=np.full(len(domains), np.nan),
+                                                where=counts[column] > 0)
+            columns[(name, 'min')] = out[2, column].copy()
+            columns[(name, 'max')] = out[3, column].copy()
+            for index, q in enumerate(quantiles):
+                columns[(name, stat_name(q))] = out[len(SUMMARY_STATS) + index, column].copy()
+        del shared_codes, shared_ages, out, counts, sums
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    return pd.DataFrame(columns, index=pd.Index(domains, name='Domain'))
+
+
+def parallel_domain_mean_ages(merged, workers=None):
+    # Drop-in for greek_gods_vectorized.domain_mean_ages
+    stats = domain_age_stats(merged, workers, percentiles=None)
+    return pd.DataFrame({name: stats[(name, 'mean')] for name in AGE_COLUMNS})
+
+
+def pandas_age_stats(merged, percentiles=DEFAULT_PERCENTILES):
+    # The same frame from pandas' groupby, for --check
+    groups = merged.groupby('Domain')[list(AGE_COLUMNS)]
+    parts = {'count': groups.count(), 'mean': groups.mean(), 'min': groups.min(),
+             'max': groups.max()}
+    for q in percentiles:
+        parts[stat_name(q)] = groups.quantile(q)
+    return pd.DataFrame({(name, stat): parts[stat][name]
+                         for name in AGE_COLUMNS for stat in parts})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--gods", default="greek_gods.csv")
+    parser.add_argument("--goddesses", default="greek_goddesses.csv")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--percentiles", default=",".join(map(str, DEFAULT_PERCENTILES)),
+                        help="comma-separated, e.g. 0.5,0.9; empty for none")
+    parser.add_argument("--check", action="store_true",
+                        help="also run the pandas groupby and compare")
+    args = parser.parse_args()
+    percentiles = tuple(float(q) for q in args.percentiles.split(",") if q)
+
+    merged = merge_tables(*load(args.gods, args.goddesses))
+
+    start = time.perf_counter()
+    means = parallel_domain_mean_ages(merged, args.workers)
+    means_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    stats = domain_age_stats(merged, args.workers, percentiles)
+    stats_seconds = time.perf_counter() - start
+    print(stats)
+    print("%d rows, %d domains, %d workers: means %.2f s, all statistics %.2f s" % (
+        len(merged), len(stats), args.workers, means_seconds, stats_seconds))
+
+    if args.check:
+        start = time.perf_counter()
+        expected_means = domain_mean_ages(merged)
+        pandas_means_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        expected = pandas_age_stats(merged, percentiles)
+        pandas_seconds = time.perf_counter() - start
+        print("pandas groupby: means %.2f s, all statistics %.2f s" % (
+            pandas_means_seconds, pandas_seconds))
+        pd.testing.assert_frame_equal(means, expected_means, check_index_type=False)
+        pd.testing.assert_frame_equal(stats, expected, check_dtype=False,
+                                      check_index_type=False)
+        # the unsorted pass, which only the means use above
+        pd.testing.assert_frame_equal(domain_age_stats(merged, args.workers, None),
+                                      pandas_age_stats(merged, ()), check_dtype=False,
+                                      check_index_type=False)
+        print("means and statistics match the pandas groupby")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Load the gods and goddesses CSVs with one categorical space per column.
+
+Domain is the merge and groupby key of greek_gods_exam.py. As str/object
+data, every merge and groupby hashes and compares millions of strings.
+load_categorical factorizes each text column of both files together, so
+both frames get the same CategoricalDtype for each of them:
+- Domain, with the categories of both files sorted,
+- Symbol,
+- the names, so that God and Goddess share one dtype.
+pd.merge and groupby('Domain') then work on the integer codes, and since the
+categories are sorted, both come out in the same order as with strings.
+combine_first of God and Goddess stays categorical as well.
+
+Usage:
+    python shared_categories.py    # the exam report from categorical frames
+"""
+import pandas as pd
+
+import greek_gods_vectorized
+
+# Columns that get one dtype across both frames: (gods column, goddesses column)
+SHARED_COLUMNS = (('Domain', 'Domain'), ('Symbol', 'Symbol'), ('God', 'Goddess'))
+
+
+def encode_pair(left, right):
+    # Both columns as categoricals of one dtype. A single sorted factorize
+    # over the two gives the codes directly, with code order = string order
+    # and missing values as -1.
+    codes, categories = pd.factorize(pd.concat([left, right], ignore_index=True), sort=True)
+    dtype = pd.CategoricalDtype(categories)
+    return (pd.Series(pd.Categorical.from_codes(codes[:len(left)], dtype=dtype),
+                      index=left.index, name=left.name),
+            pd.Series(pd.Categorical.from_codes(codes[len(left):], dtype=dtype),
+                      index=right.index, name=right.name))
+
+
+def encode_shared(gods, goddesses):
+    gods = gods.copy()
+    goddesses = goddesses.copy()
+    for gods_column, goddesses_column in SHARED_COLUMNS:
+        gods[gods_column], goddesses[goddesses_column] = encode_pair(
+            gods[gods_column], goddesses[goddesses_column])
+    return gods, goddesses
+
+
+def load_categorical(gods_path='greek_gods.csv', goddesses_path='greek_goddesses.csv'):
+    return encode_shared(*greek_gods_vectorized.load(gods_path, goddesses_path))
+
+
+if __name__ == "__main__":
+    greek_gods_vectorized.main(load_categorical)